@@ -15,6 +15,13 @@ Usage:
     result = await analyze_header_elements(header_image_path, html_path)
 """
 
+import os
+from dotenv import load_dotenv
+
+# Load .env once for the whole package, skipped when the key is already in the environment
+if not os.getenv("OPENAI_API_KEY"):
+    load_dotenv()
+
 from .header_analyzer import analyze_header_elements
 from .footer_analyzer import analyze_footer_elements
 
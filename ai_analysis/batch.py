@@ -0,0 +1,171 @@
+"""
+Batch API Module
+
+Submits chat completion requests through the OpenAI Batch API instead of
+one real-time call per request. Batch jobs are roughly half the price and
+are not bound by per-request rate limits, at the cost of a completion
+window of up to 24 hours - suited to bulk, non-interactive crawls.
+
+Usage:
+    requests = [build_batch_request("page-1", {"model": "gpt-5-mini", "messages": [...]})]
+    results = await run_batch(client, requests)
+"""
+
+import sys
+import json
+import asyncio
+from typing import Dict, List, Any, Optional, Set, Tuple
+from openai import AsyncOpenAI
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_request(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Wrap a chat completion request body as one line of a batch input file.
+
+    Args:
+        custom_id: Identifier used to match the result back to the request
+        body: Keyword arguments that would be passed to chat.completions.create
+
+    Returns:
+        Batch request dictionary
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body
+    }
+
+
+async def run_batch(client: AsyncOpenAI, requests: List[Dict[str, Any]], poll_interval: int = 60) -> Dict[str, Dict[str, Any]]:
+    """
+    Upload batch requests, wait for the batch to finish and collect the results.
+
+    Args:
+        client: AsyncOpenAI client
+        requests: Batch request dictionaries from build_batch_request
+        poll_interval: Seconds to wait between status checks
+
+    Returns:
+        Dictionary mapping custom_id to either {"response": <chat completion body>}
+        or {"error": <error message>}
+
+    Raises:
+        Exception: If the batch itself fails, expires or is cancelled
+    """
+    jsonl_bytes = "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+
+    print(f"    > Uploading batch of {len(requests)} requests...", file=sys.stderr)
+    input_file = await client.files.create(file=("batch_input.jsonl", jsonl_bytes), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h"
+    )
+    print(f"    > Batch {batch.id} submitted, polling every {poll_interval}s...", file=sys.stderr)
+
+    while batch.status not in _TERMINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed":
+        raise Exception(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                results[record["custom_id"]] = {"error": str(record.get("error") or response.get("body"))}
+            else:
+                results[record["custom_id"]] = {"response": response["body"]}
+
+    print(f"    > Batch {batch.id} completed: {len(results)}/{len(requests)} results", file=sys.stderr)
+    return results
+
+
+class BatchDispatcher:
+    """
+    Collects chat completion requests from concurrently running analysis
+    pipelines and submits them together as one Batch API job.
+
+    A batch is flushed once every pipeline that is still running is waiting
+    on a request, so multi-step pipelines naturally become one batch per step.
+    """
+
+    def __init__(self, client: AsyncOpenAI, pipeline_count: int, poll_interval: int = 60):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            client: AsyncOpenAI client used to submit the batches
+            pipeline_count: Number of pipelines that will share this dispatcher
+            poll_interval: Seconds to wait between batch status checks
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self._active = pipeline_count
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._batches_submitted = 0
+        # The event loop only keeps weak references to tasks, so hold on to in-flight submissions
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def complete(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a chat completion request and wait for its batch result.
+
+        Args:
+            body: Keyword arguments that would be passed to chat.completions.create
+
+        Returns:
+            Chat completion response body as a dictionary
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((body, future))
+        self._maybe_flush()
+        return await future
+
+    def pipeline_finished(self) -> None:
+        """Mark one pipeline as done so remaining requests are not held back for it."""
+        self._active -= 1
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if self._pending and len(self._pending) >= self._active:
+            pending, self._pending = self._pending, []
+            task = asyncio.ensure_future(self._submit(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _submit(self, pending: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        self._batches_submitted += 1
+        prefix = f"batch{self._batches_submitted}"
+        requests = [build_batch_request(f"{prefix}-{i}", body) for i, (body, _) in enumerate(pending)]
+
+        try:
+            results = await run_batch(self.client, requests, self.poll_interval)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for request, (_, future) in zip(requests, pending):
+            result: Optional[Dict[str, Any]] = results.get(request["custom_id"])
+            if future.done():
+                continue
+            if result is None:
+                future.set_exception(Exception(f"No batch result for request {request['custom_id']}"))
+            elif "error" in result:
+                future.set_exception(Exception(f"Batch request failed: {result['error']}"))
+            else:
+                future.set_result(result["response"])
@@ -5,30 +5,416 @@ Uses GPT-5 to analyze body images and associated HTML to extract
 links, UI elements, and interactive components from website body content.
 """
 
-import os
 import sys
-import base64
 import json
 import re
+import random
+import asyncio
+import functools
+import contextvars
+from collections import Counter
+import httpx
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
-from dotenv import load_dotenv
-from openai import OpenAI
+from typing import Dict, List, Any, Optional, Tuple, Union
+from openai import AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from openai.types.chat import ChatCompletion
 from urllib.parse import urljoin, urlparse
 
-# Load environment variables
-load_dotenv()
+try:
+    # orjson parses several times faster than the stdlib; its JSONDecodeError subclasses json.JSONDecodeError
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from .response_cache import response_cache, make_cache_key, normalize_prompt_text, file_digest
+    from .batch import BatchDispatcher
+    from .rate_limiter import RateLimiter
+    from .utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision, minify_html_for_llm,
+                        iter_json_objects, read_streamed_json, json_schema_format,
+                        TEMPLATE_FEATURES_SCHEMA, CUSTOM_FEATURES_SCHEMA)
+except ImportError:
+    # Run directly as a script, outside the ai_analysis package
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ai_analysis.response_cache import response_cache, make_cache_key, normalize_prompt_text, file_digest
+    from ai_analysis.batch import BatchDispatcher
+    from ai_analysis.rate_limiter import RateLimiter
+    from ai_analysis.utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision,
+                                   minify_html_for_llm, iter_json_objects, read_streamed_json, json_schema_format,
+                                   TEMPLATE_FEATURES_SCHEMA, CUSTOM_FEATURES_SCHEMA)
+
+_get_client = get_async_openai_client
+
+
+# Transient API errors retried by _request_analysis with jittered exponential backoff: 429s,
+# timeouts, connection failures, 5xx responses and transport errors while reading a stream.
+# Anything else (e.g. BadRequestError) surfaces immediately.
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, httpx.TransportError)
+_MAX_ATTEMPTS = 6
+_MAX_RETRY_DELAY = 30
+
+# Part of the response cache key; bump when the body prompts change so stale analyses are not reused
+_BODY_PROMPT_VERSION = "body-v1"
+
+# Template dictionary; its content digest is also part of the response cache key
+_DICTIONARY_PATH = Path(__file__).parent / "ecommerce_dictionary.json"
+
+# Set by analyze_body_elements_batched so GPT calls are routed through the Batch API
+_batch_dispatcher: contextvars.ContextVar[Optional[BatchDispatcher]] = contextvars.ContextVar("_batch_dispatcher", default=None)
+
+# Set by analyze_many so real-time GPT calls share one requests-per-minute budget
+_rate_limiter: contextvars.ContextVar[Optional[RateLimiter]] = contextvars.ContextVar("_rate_limiter", default=None)
+
+
+# Page templates the body can be classified as (must match ecommerce_dictionary.json names)
+BODY_TEMPLATE_NAMES = [
+    "Homepage", "Category Page", "Search Results", "Product Detail", "Cart", "Checkout",
+    "My Account", "Wishlist", "Comparison Page", "Store Locator", "Contact Us", "Gift Registry", "Content"
+]
+
+# Bullet list of the template names as embedded in the combined prompts
+_TEMPLATE_NAME_LIST = "\n".join(f"- {name}" for name in BODY_TEMPLATE_NAMES)
+
+# JSON schemas for OpenAI structured outputs - they mirror the formats described in the prompts
+TEMPLATE_DETECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "template_name": {"type": "string", "enum": BODY_TEMPLATE_NAMES},
+        "confidence_score": {"type": "integer", "enum": [0, 1, 2, 3]},
+        "justification": {"type": "string"},
+        "url_indicators": {"type": "string"},
+        "content_indicators": {"type": "string"}
+    },
+    "required": ["template_name", "confidence_score", "justification", "url_indicators", "content_indicators"],
+    "additionalProperties": False
+}
+
+TEMPLATE_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **TEMPLATE_DETECTION_SCHEMA["properties"],
+        "features": TEMPLATE_FEATURES_SCHEMA["properties"]["features"]
+    },
+    "required": TEMPLATE_DETECTION_SCHEMA["required"] + ["features"],
+    "additionalProperties": False
+}
+
+PACKED_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    **TEMPLATE_ANALYSIS_SCHEMA["properties"],
+                    "custom_features": CUSTOM_FEATURES_SCHEMA["properties"]["custom_features"]
+                },
+                "required": ["id"] + TEMPLATE_ANALYSIS_SCHEMA["required"] + ["custom_features"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["pages"],
+    "additionalProperties": False
+}
+
+
+# Prompts are split into a static instruction block and a per-page block. The
+# instructions go first and are identical across pages (per template for the
+# feature prompts), so OpenAI prompt caching can reuse them as a cached prefix;
+# the URL, HTML and screenshot that differ on every page are sent last.
+
+# User prompt for detect_body_template
+_TEMPLATE_DETECTION_INSTRUCTIONS = """
+Please analyze the website body content provided below and determine what template type it represents.
+
+Available template types (use exact names):
+- Homepage
+- Category Page  
+- Search Results
+- Product Detail
+- Cart
+- Checkout
+- My Account
+- Wishlist
+- Comparison Page
+- Store Locator
+- Contact Us
+- Gift Registry
+- Content
+
+CONFIDENCE SCORING:
+- 0: No confidence - Cannot determine template type
+- 1: Low confidence - Some indicators but unclear
+- 2: Medium confidence - Clear indicators present
+- 3: High confidence - Very clear indicators (e.g., URL is domain root = Homepage)
+
+ANALYSIS CRITERIA:
+- URL patterns (e.g., "/" = Homepage, "/category/" = Category Page, "/product/" = Product Detail)
+- Page title content
+- Visual layout and structure from image
+- HTML content structure and elements
+- Presence of specific UI components
+
+Return your analysis as a JSON object with this structure:
+{
+  "template_name": "Template name from the list above",
+  "confidence_score": 0-3,
+  "justification": "One sentence explaining why you chose this template and confidence level",
+  "url_indicators": "URL patterns that influenced the decision",
+  "content_indicators": "Content/layout elements that influenced the decision"
+}
+"""
+
+_TEMPLATE_DETECTION_PAGE = """
+Website URL: {url}
+Page Title: {page_title}
+
+Body HTML Outline (one element per line: tag#id.class[attribute=value] text):
+{processed_html}
+"""
+
+# User prompt for analyze_body_template (template detection and feature check in one call)
+_TEMPLATE_ANALYSIS_INSTRUCTIONS = """
+Please analyze the website body content provided below. First determine what template type it represents, then check which of that template's standard features are present.
+
+Available template types (use exact names):
+{template_names}
+
+CONFIDENCE SCORING:
+- 0: No confidence - Cannot determine template type
+- 1: Low confidence - Some indicators but unclear
+- 2: Medium confidence - Clear indicators present
+- 3: High confidence - Very clear indicators (e.g., URL is domain root = Homepage)
+
+ANALYSIS CRITERIA:
+- URL patterns (e.g., "/" = Homepage, "/category/" = Category Page, "/product/" = Product Detail)
+- Page title content
+- Visual layout and structure from image
+- HTML content structure and elements
+- Presence of specific UI components
+
+TEMPLATE FEATURE CHECKLISTS:
+{checklists}
+
+FEATURE INSTRUCTIONS:
+1. Use the checklist of the template you chose and return every feature from it exactly once, with its name as written
+2. Look at the body image to identify visual elements and cross-reference with the HTML code provided
+3. Base your decision on both visual evidence from the image AND HTML structure
+4. Be thorough but conservative - only mark "yes" if you can clearly see evidence
+5. If your confidence score is 0 or 1, return an empty features array
+
+Return your analysis as a JSON object with this structure:
+{{
+  "template_name": "Template name from the list above",
+  "confidence_score": 0-3,
+  "justification": "One sentence explaining why you chose this template and confidence level",
+  "url_indicators": "URL patterns that influenced the decision",
+  "content_indicators": "Content/layout elements that influenced the decision",
+  "features": [
+    {{
+      "name": "Feature Name",
+      "description": "Feature Description", 
+      "found": "yes" or "no"
+    }}
+  ]
+}}
+"""
+
+# User prompt for analyze_body_elements_packed (several pages per request)
+_PACKED_ANALYSIS_INSTRUCTIONS = """
+Please analyze each of the website pages provided below. Every page is given as its ID, URL, page title and
+body HTML outline, followed by a screenshot of its body. Analyze every page independently.
+
+For each page:
+1. Determine what template type it represents
+2. Check which of that template's standard features are present
+3. Identify up to 5 CUSTOM features that are NOT in the standard template
+
+Available template types (use exact names):
+{template_names}
+
+CONFIDENCE SCORING:
+- 0: No confidence - Cannot determine template type
+- 1: Low confidence - Some indicators but unclear
+- 2: Medium confidence - Clear indicators present
+- 3: High confidence - Very clear indicators (e.g., URL is domain root = Homepage)
+
+ANALYSIS CRITERIA:
+- URL patterns (e.g., "/" = Homepage, "/category/" = Category Page, "/product/" = Product Detail)
+- Page title content
+- Visual layout and structure from image
+- HTML content structure and elements
+- Presence of specific UI components
+
+TEMPLATE FEATURE CHECKLISTS:
+{checklists}
+
+FEATURE INSTRUCTIONS:
+1. Use the checklist of the template you chose and return every feature from it exactly once, with its name as written
+2. Base your decision on both visual evidence from the page's screenshot AND its HTML structure
+3. Be thorough but conservative - only mark "yes" if you can clearly see evidence
+4. If your confidence score is 0 or 1, return empty features and custom_features arrays
+
+CUSTOM FEATURES:
+- Unique widgets, custom sections, special tools, or innovative UI elements beyond the checklist
+- **Name**: Keep it SHORT (2-4 words max); **Description**: Keep it BRIEF (1-2 sentences max)
+- Return an empty array if no significant custom features are found
+
+Return your analysis as a JSON object with one entry per page, using the page IDs given:
+{{
+  "pages": [
+    {{
+      "id": "Page ID",
+      "template_name": "Template name from the list above",
+      "confidence_score": 0-3,
+      "justification": "One sentence explaining why you chose this template and confidence level",
+      "url_indicators": "URL patterns that influenced the decision",
+      "content_indicators": "Content/layout elements that influenced the decision",
+      "features": [
+        {{
+          "name": "Feature Name",
+          "description": "Feature Description", 
+          "found": "yes" or "no"
+        }}
+      ],
+      "custom_features": [
+        {{
+          "name": "Live Chat Widget",
+          "description": "Interactive chat support tool for customer assistance."
+        }}
+      ]
+    }}
+  ]
+}}
+"""
+
+_PACKED_ANALYSIS_PAGE = """
+PAGE ID: {page_id}
+Website URL: {url}
+Page Title: {page_title}
+
+Body HTML Outline (one element per line: tag#id.class[attribute=value] text):
+{processed_html}
+
+Screenshot of page {page_id}:
+"""
+
+# User prompt for detect_custom_features
+_CUSTOM_FEATURES_INSTRUCTIONS = """
+Please analyze the {template_name} page provided below and identify CUSTOM features that are NOT in the standard template.
+
+INSTRUCTIONS:
+1. Look at the screenshot and HTML for additional functionality beyond the standard features listed with the page
+2. Identify unique/custom elements specific to this page or site
+3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
+4. Examples might include: Live chat widgets, product comparison tools, custom calculators, special promotional sections, unique navigation elements, custom forms, interactive elements, etc.
+5. Only return features that are clearly visible and functional in the screenshot/HTML
+6. Return 3-5 most significant custom features (if any exist)
+7. If no significant custom features are found, return an empty array
+
+NAMING REQUIREMENTS:
+- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
+- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
+
+Return your analysis as a JSON object with this structure:
+{{
+  "custom_features": [
+    {{
+      "name": "Live Chat Widget",
+      "description": "Interactive chat support tool for customer assistance."
+    }},
+    {{
+      "name": "Size Guide",
+      "description": "Pop-up sizing chart with measurements and fit recommendations."
+    }}
+  ]
+}}
+"""
+
+_CUSTOM_FEATURES_PAGE = """
+Website URL: {url}
+
+HTML Content:
+{processed_html}
+
+STANDARD FEATURES ALREADY IDENTIFIED:
+{standard_features_text}
+"""
+
+# User prompt for analyze_template_features
+_TEMPLATE_FEATURES_INSTRUCTIONS = """
+Please analyze the {template_name} page provided below and determine which features are present.
+
+Template Features to Check:
+{features_text}
+
+INSTRUCTIONS:
+1. Look at the body image to identify visual elements
+2. Cross-reference with the HTML code provided
+3. For each feature listed above, determine if it's present ("yes") or not present ("no")
+4. Base your decision on both visual evidence from the image AND HTML structure
+5. Be thorough but conservative - only mark "yes" if you can clearly see evidence
+
+Return your analysis as a JSON object with this structure:
+{{
+  "name": "{template_name}",
+  "description": "{template_description}",
+  "features": [
+    {{
+      "name": "Feature Name",
+      "description": "Feature Description", 
+      "found": "yes" or "no"
+    }}
+  ]
+}}
+"""
+
+_TEMPLATE_FEATURES_PAGE = """
+Website URL: {url}
+
+HTML Outline (one element per line: tag#id.class[attribute=value] text):
+{processed_html}
+"""
+
+@functools.lru_cache(maxsize=64)
+def _render_instructions(template: str, **fields: str) -> str:
+    """
+    Fill in a static instruction template, memoized per template and field values.
+    
+    The instruction blocks only depend on the template and the (per-template)
+    feature lists, so each distinct block is built once and then reused
+    verbatim, which also keeps the cached prompt prefix byte-identical.
+    """
+    return template.format(**fields)
+
+
+# JSON cleanup patterns used by _extract_json_from_response, compiled once at import
+_MARKDOWN_QUOTE_RE = re.compile(r'^>\s*', re.MULTILINE)
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
 
 
 def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
-    """Extract JSON from GPT-5 Chat Completions API output with robust error handling."""
+    """Extract JSON from GPT-5 Chat Completions API output (or its raw text) with robust error handling."""
     data = None
     
     # Extract text from chat completions response
+    if isinstance(resp, str):
+        raw_text = resp.strip()
+    else:
+        try:
+            raw_text = resp.choices[0].message.content.strip()
+        except (AttributeError, IndexError):
+            raw_text = str(resp)
+    
+    # Structured outputs return the JSON document as-is, so try a direct parse first
     try:
-        raw_text = resp.choices[0].message.content.strip()
-    except (AttributeError, IndexError):
-        raw_text = str(resp)
+        data = _json_loads(raw_text)
+    except json.JSONDecodeError:
+        pass
     
     # If no structured JSON found, try to parse the raw text as JSON
     if data is None and raw_text:
@@ -41,36 +427,26 @@ def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
                 cleaned_text = cleaned_text[:-3]
             
             # Remove leading > characters that might be from markdown quotes
-            cleaned_text = re.sub(r'^>\s*', '', cleaned_text, flags=re.MULTILINE)
+            cleaned_text = _MARKDOWN_QUOTE_RE.sub('', cleaned_text)
             cleaned_text = cleaned_text.strip()
             
             # Try to parse the cleaned text as JSON
-            data = json.loads(cleaned_text)
-            print(f"      > Successfully parsed JSON after cleaning", file=sys.stderr)
+            data = _json_loads(cleaned_text)
+            print("      > Successfully parsed JSON after cleaning", file=sys.stderr)
         except json.JSONDecodeError as e:
-            print(f"      > JSON parse error: {str(e)}", file=sys.stderr)
-            # Try to find JSON within the text using more robust pattern
-            json_patterns = [
-                r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}',  # Simple nested objects
-                r'\{.*?"navigation_links".*?\}',      # Look for our expected structure
-                r'\{.*?\}(?=\s*$)',                   # JSON at end of text
-            ]
-            
-            for pattern in json_patterns:
-                json_match = re.search(pattern, raw_text, re.DOTALL)
-                if json_match:
-                    try:
-                        candidate_json = json_match.group()
-                        # Clean up common JSON issues
-                        candidate_json = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', candidate_json)  # Remove control chars
-                        candidate_json = re.sub(r',\s*}', '}', candidate_json)  # Remove trailing commas
-                        candidate_json = re.sub(r',\s*]', ']', candidate_json)  # Remove trailing commas in arrays
-                        
-                        data = json.loads(candidate_json)
-                        print(f"      > Successfully extracted JSON using pattern matching", file=sys.stderr)
-                        break
-                    except json.JSONDecodeError:
-                        continue
+            print(f"      > JSON parse error: {e}", file=sys.stderr)
+            # Try to find a JSON object embedded in the text
+            for candidate_json in iter_json_objects(raw_text):
+                try:
+                    # Clean up common JSON issues
+                    candidate_json = _CONTROL_CHARS_RE.sub('', candidate_json)  # Remove control chars
+                    candidate_json = _TRAILING_COMMA_RE.sub(r'\1', candidate_json)  # Remove trailing commas
+                    
+                    data = _json_loads(candidate_json)
+                    print("      > Successfully extracted JSON from surrounding text", file=sys.stderr)
+                    break
+                except json.JSONDecodeError:
+                    continue
             
             if data is None:
                 print(f"      > Failed to extract valid JSON. Raw response preview: {raw_text[:200]}...", file=sys.stderr)
@@ -78,16 +454,199 @@ def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
     return data, raw_text
 
 
-def _encode_image_to_base64(image_path: Path) -> str:
-    """Encode an image file to base64 string."""
+async def _request_analysis(client: AsyncOpenAI, system_prompt: str, instructions: str,
+                            page_text: Union[str, List[str]], image_url: Union[str, List[str]],
+                            response_format: Optional[Dict[str, Any]] = None) -> Tuple[Optional[dict], str]:
+    """
+    Send a text + screenshot prompt to GPT-5-mini and parse the JSON reply.
+    
+    The user message is ordered static-first: the shared instructions, then the
+    per-page text, then the screenshot, so the unchanging prefix can be served
+    from OpenAI's prompt cache. page_text and image_url may also be parallel
+    lists to send several pages in one request, each text followed by its image.
+    
+    When response_format is given (see json_schema_format) the API enforces
+    the schema, so the reply parses directly without the JSON-repair fallbacks.
+    
+    Real-time replies are streamed and reading stops as soon as the JSON object
+    is complete (see read_streamed_json).
+    
+    Parsed replies are stored in the shared response cache keyed by the model,
+    prompt version, template dictionary digest, prompts and image, so re-analyzing an unchanged page skips the API call.
+    
+    Returns:
+        Tuple of (parsed_json_dict, raw_text_response)
+    """
+    page_texts = [page_text] if isinstance(page_text, str) else page_text
+    image_urls = [image_url] if isinstance(image_url, str) else image_url
+    
+    cache_key = make_cache_key("gpt-5-mini", _BODY_PROMPT_VERSION, file_digest(_DICTIONARY_PATH),
+                               system_prompt, instructions,
+                               *[normalize_prompt_text(text) for text in page_texts], *image_urls,
+                               json.dumps(response_format, sort_keys=True))
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        print("    > Using cached GPT-5 response", file=sys.stderr)
+        return cached["data"], cached["raw_text"]
+    
+    request_body = {
+        "model": "gpt-5-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": instructions
+                    }
+                ]
+            }
+        ]
+    }
+    for text, url in zip(page_texts, image_urls):
+        request_body["messages"][1]["content"].append({"type": "text", "text": text})
+        request_body["messages"][1]["content"].append({"type": "image_url", "image_url": {"url": url}})
+    if response_format:
+        request_body["response_format"] = response_format
+    
+    dispatcher = _batch_dispatcher.get()
+    if dispatcher is not None:
+        response = ChatCompletion.model_validate(await dispatcher.complete(request_body))
+    else:
+        limiter = _rate_limiter.get()
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            if limiter is not None:
+                await limiter.acquire()
+            try:
+                stream = await client.chat.completions.create(**request_body, stream=True)
+                response = await read_streamed_json(stream)
+                break
+            except _RETRYABLE_ERRORS as e:
+                if attempt == _MAX_ATTEMPTS:
+                    raise
+                # Full jitter keeps concurrent pages from retrying in lockstep
+                delay = random.uniform(0, min(_MAX_RETRY_DELAY, 2 ** attempt))
+                print(f"    > {type(e).__name__} on attempt {attempt}/{_MAX_ATTEMPTS}, retrying in {delay:.1f}s...", file=sys.stderr)
+                await asyncio.sleep(delay)
+    
+    analysis_data, raw_text = _extract_json_from_response(response)
+    if analysis_data:
+        response_cache.set(cache_key, {"data": analysis_data, "raw_text": raw_text})
+    return analysis_data, raw_text
+
+
+def _sniff_image_mime_type(image_path: Path) -> str:
+    """Detect the image MIME type from its magic bytes, defaulting to PNG."""
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        header = image_file.read(12)
+    if header.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def _encode_image_to_data_url(image_path: Path) -> str:
+    """
+    Encode an image file as a data URL ready to pass as image_url.url.
+    
+    Results are cached by path, modification time and size, so re-analyzing an
+    unchanged screenshot (retries, fallbacks, re-runs) skips the re-encode.
+    """
+    stat = image_path.stat()
+    return _cached_image_data_url(str(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_image_data_url(image_path: str, mtime_ns: int, size: int) -> str:
+    """Encode the image at image_path as a data URL; mtime_ns and size only key the cache."""
+    path = Path(image_path)
+    try:
+        data_url = encode_image_for_vision(path)
+        if data_url:
+            return data_url
+    except (OSError, ValueError) as e:
+        # Unreadable by Pillow or no WebP support - send the original file unchanged
+        print(f"    > Warning: Could not re-encode {path.name} for vision ({e}), sending original image", file=sys.stderr)
+    return encode_image_to_base64(path, prefix="data:" + _sniff_image_mime_type(path) + ";base64,")
 
 
 def _load_html_content(html_path: Path) -> str:
     """Load HTML content from file."""
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return html_path.read_text(encoding="utf-8")
+
+
+@functools.lru_cache(maxsize=1)
+def _load_ecommerce_dictionary() -> Dict[str, Any]:
+    """Load the ecommerce template dictionary that lists the features of each template (cached per process)."""
+    return _json_loads(_DICTIONARY_PATH.read_bytes())
+
+
+@functools.lru_cache(maxsize=1)
+def _get_template_index() -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[int]], Dict[str, str], List[Dict[str, Any]]]:
+    """
+    Build the template lookup structures once per process.
+    
+    Returns:
+        Tuple of (templates by lower-cased name, also reachable without the
+        " template" suffix; indices of the templates containing each name word,
+        for fuzzy matching; numbered feature list text by template name;
+        templates in dictionary order)
+    """
+    templates = _load_ecommerce_dictionary().get('templates', [])
+    
+    exact_names: Dict[str, Dict[str, Any]] = {}
+    clean_names: Dict[str, Dict[str, Any]] = {}
+    word_index: Dict[str, List[int]] = {}
+    features_text_by_name: Dict[str, str] = {}
+    for index, template in enumerate(templates):
+        name = template.get('name', '')
+        clean_name = name.lower().replace(' template', '')
+        exact_names.setdefault(name.lower(), template)
+        clean_names.setdefault(clean_name, template)
+        for word in set(clean_name.split()):
+            word_index.setdefault(word, []).append(index)
+        features_text_by_name[name] = "".join(
+            f"{i}. {feature.get('name', 'Unknown')}: {feature.get('description', 'No description')}\n"
+            for i, feature in enumerate(template.get('features', []), 1)
+        )
+    
+    # Exact names take precedence over names matched without the " template" suffix
+    return {**clean_names, **exact_names}, word_index, features_text_by_name, templates
+
+
+def _find_template(template_name: str) -> Optional[Dict[str, Any]]:
+    """Find a dictionary template by name, falling back to the template sharing the most name words."""
+    templates_by_name, word_index, _, templates = _get_template_index()
+    template_data = templates_by_name.get(template_name.lower())
+    if template_data:
+        return template_data
+    
+    scores: Counter = Counter()
+    for word in set(template_name.lower().split()):
+        scores.update(word_index.get(word, ()))
+    if not scores:
+        return None
+    
+    # Highest shared word count wins; ties go to the template listed first
+    best_index = min(scores, key=lambda index: (-scores[index], index))
+    best_match = templates[best_index]
+    if best_match:
+        print(f"    > Using fuzzy match: '{template_name}' -> '{best_match.get('name')}'", file=sys.stderr)
+    return best_match
+
+
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+
+def _extract_page_title(html_content: str) -> str:
+    """Extract the page title from HTML, or return an empty string if there is none."""
+    title_match = _TITLE_RE.search(html_content)
+    return title_match.group(1).strip() if title_match else ""
 
 
 def _chunk_html_content(html_content: str, chunk_size: int = 48000) -> List[str]:
@@ -137,51 +696,352 @@ def _chunk_html_content(html_content: str, chunk_size: int = 48000) -> List[str]
     return chunks
 
 
+# Matches href attributes whose value is double-quoted, single-quoted or unquoted; the lookbehind
+# skips look-alikes such as data-href, xlink:href and ng-href
+_HREF_ATTR_RE = re.compile(r'''((?<![\w:-])href\s*=\s*)(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''', re.IGNORECASE)
+
+
+# Outline format produced by _distill_html
+_OUTLINE_TOKEN_RE = re.compile(r'<(/?)([a-zA-Z][\w-]*)([^<>]*)>|([^<]+)')
+_ATTRIBUTE_VALUE_RE = re.compile(r'''([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+)))?''')
+_INLINE_TAGS = frozenset({'b', 'i', 'em', 'strong', 'small', 'span', 'br', 'sup', 'sub', 'u', 'mark'})
+_OUTLINE_MAX_CLASSES = 3
+_OUTLINE_MAX_TEXT = 200
+DISTILLED_HTML_MAX_CHARS = 8000
+
+
+def _outline_label(tag: str, attributes: str) -> str:
+    """Format a start tag as tag#id.class[attr=value] for the HTML outline."""
+    label = tag
+    extras = []
+    for attr in _ATTRIBUTE_VALUE_RE.finditer(attributes):
+        name = attr.group(1).lower()
+        value = next((v for v in attr.groups()[1:] if v is not None), "")
+        if not value:
+            continue
+        if name == 'id':
+            label += f"#{value}"
+        elif name == 'class':
+            label += "".join(f".{cls}" for cls in value.split()[:_OUTLINE_MAX_CLASSES])
+        else:
+            extras.append(f"[{name}={value}]")
+    return label + "".join(extras)
+
+
+def _distill_html(html_content: str, max_chars: int = DISTILLED_HTML_MAX_CHARS) -> str:
+    """
+    Condense minified HTML into a compact outline for prompting.
+    
+    Each element that has identifying attributes or text becomes one line,
+    "tag#id.class[href=...] text"; closing tags, bare wrappers and inline
+    formatting tags are folded away. The outline stops at max_chars, which keeps
+    the structural signal the model needs at a fraction of the HTML's tokens.
+    
+    Args:
+        html_content: HTML already processed by _preprocess_body_html_for_analysis
+        max_chars: Maximum length of the outline
+        
+    Returns:
+        Outline text, one element per line
+    """
+    lines: List[str] = []
+    total = 0
+    label, is_bare = "", True
+    text_parts: List[str] = []
+    
+    def flush() -> bool:
+        nonlocal total
+        text = " ".join(text_parts)
+        if len(text) > _OUTLINE_MAX_TEXT:
+            text = text[:_OUTLINE_MAX_TEXT] + "..."
+        if text or not is_bare:
+            line = f"{label} {text}".strip()
+            total += len(line) + 1
+            if total > max_chars:
+                return False
+            lines.append(line)
+        return True
+    
+    for match in _OUTLINE_TOKEN_RE.finditer(html_content):
+        closing, tag, attributes, text = match.groups()
+        if text is not None:
+            text = text.strip()
+            if text:
+                text_parts.append(text)
+            continue
+        
+        tag = tag.lower()
+        attributes = attributes.strip().rstrip('/')
+        if tag in _INLINE_TAGS and not attributes:
+            continue
+        if not flush():
+            break
+        text_parts = []
+        if closing:
+            label, is_bare = "", True
+        else:
+            label = _outline_label(tag, attributes)
+            is_bare = label == tag
+    else:
+        flush()
+    
+    return "\n".join(lines)
+
+
 def _preprocess_body_html_for_analysis(html_content: str, base_url: str = "") -> str:
     """
     Preprocess body HTML to convert relative URLs to absolute URLs and extract main content.
     This helps the AI find actual URLs from the body content.
-    """
-    from urllib.parse import urljoin, urlparse
     
-    # Find all href links in the HTML
-    href_links = re.findall(r'href="([^"]*)"', html_content)
+    All href attributes are rewritten in a single pass over the HTML, so the
+    cost stays linear in the HTML size regardless of how many links it has.
+    The result is then minified with minify_html_for_llm. Callers prepare each
+    page once (see _prepare_body_page), so the result is not memoized.
+    """
+    # Parse the base URL once rather than for every root-relative link
+    parsed_base = urlparse(base_url)
+    root_url = f"{parsed_base.scheme}://{parsed_base.netloc}"
+    # Pages repeat the same hrefs (logo, mega-menu, product tiles), so resolve each distinct link once
+    absolute_urls: Dict[str, str] = {}
     
-    # Convert relative URLs to absolute URLs
-    absolute_links = []
-    if base_url:
-        for link in href_links:
-            if link.startswith('http'):
-                absolute_links.append(link)
-            elif link.startswith('/'):
+    def absolutize_href(match: re.Match) -> str:
+        prefix, double_quoted, single_quoted, unquoted = match.groups()
+        link = next(value for value in (double_quoted, single_quoted, unquoted) if value is not None)
+        
+        if link.startswith('http'):
+            return match.group(0)
+        
+        absolute_url = absolute_urls.get(link)
+        if absolute_url is None:
+            if link.startswith('/'):
                 # Relative to domain root
-                parsed_base = urlparse(base_url)
-                absolute_url = f"{parsed_base.scheme}://{parsed_base.netloc}{link}"
-                absolute_links.append(absolute_url)
+                absolute_url = root_url + link
             elif link.startswith('#'):
                 # Fragment/anchor link
                 absolute_url = f"{base_url}{link}"
-                absolute_links.append(absolute_url)
             else:
                 # Relative path
                 absolute_url = urljoin(base_url, link)
-                absolute_links.append(absolute_url)
-    else:
-        absolute_links = href_links
+            absolute_urls[link] = absolute_url
+        
+        quote = "'" if single_quoted is not None else '"'
+        return f"{prefix}{quote}{absolute_url}{quote}"
+    
+    processed_html = _HREF_ATTR_RE.sub(absolutize_href, html_content) if base_url else html_content
+    
+    minified_html = minify_html_for_llm(processed_html)
+    print(f"    > Minified body HTML for prompt: {format(len(processed_html), ',')} -> {format(len(minified_html), ',')} chars", file=sys.stderr)
+    return minified_html
+
+
+# URL path patterns that identify a template with high confidence, checked in order
+_URL_TEMPLATE_RULES = [
+    (re.compile(r'^/?(index\.\w+)?$'), "Homepage"),
+    (re.compile(r'/(cart|basket|bag)(/|$)', re.IGNORECASE), "Cart"),
+    (re.compile(r'/checkout(/|$)', re.IGNORECASE), "Checkout"),
+    (re.compile(r'/(wishlist|wish-list|favorites)(/|$)', re.IGNORECASE), "Wishlist"),
+    (re.compile(r'/(account|my-account|myaccount)(/|$)', re.IGNORECASE), "My Account"),
+    (re.compile(r'/(search|catalogsearch)(/|$)', re.IGNORECASE), "Search Results"),
+    (re.compile(r'/(compare|comparison)(/|$)', re.IGNORECASE), "Comparison Page"),
+    (re.compile(r'/(store-locator|stores|store-finder)(/|$)', re.IGNORECASE), "Store Locator"),
+    (re.compile(r'/(contact|contact-us)(/|$)', re.IGNORECASE), "Contact Us"),
+    (re.compile(r'/(registry|gift-registry)(/|$)', re.IGNORECASE), "Gift Registry"),
+    (re.compile(r'/(product|products|p)/', re.IGNORECASE), "Product Detail"),
+    (re.compile(r'/(category|categories|collections|c)/', re.IGNORECASE), "Category Page"),
+]
+
+
+def _heuristic_template(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Classify a page from its URL alone when the path is unambiguous.
+    
+    Returns:
+        Tuple of (template_name, matched URL path) for a confident match, or None
+    """
+    if not url:
+        return None
+    path = urlparse(url).path
+    for pattern, template_name in _URL_TEMPLATE_RULES:
+        if pattern.search(path):
+            return template_name, path or "/"
+    return None
+
+
+# Page title phrases that suggest a template; weaker than the URL rules, used only to pick speculation
+# candidates when the URL rules found nothing
+_TITLE_TEMPLATE_RULES = [
+    (re.compile(r'\b(shopping cart|your cart|basket|shopping bag)\b', re.IGNORECASE), "Cart"),
+    (re.compile(r'\bcheckout\b', re.IGNORECASE), "Checkout"),
+    (re.compile(r'\b(search results|results for)\b', re.IGNORECASE), "Search Results"),
+    (re.compile(r'\b(my account|sign in|log in|login)\b', re.IGNORECASE), "My Account"),
+    (re.compile(r'\b(wishlist|wish list|favorites)\b', re.IGNORECASE), "Wishlist"),
+    (re.compile(r'\b(store locator|find a store|store finder)\b', re.IGNORECASE), "Store Locator"),
+    (re.compile(r'\bcontact( us)?\b', re.IGNORECASE), "Contact Us"),
+    (re.compile(r'\bgift registry\b', re.IGNORECASE), "Gift Registry"),
+    (re.compile(r'\bcompare\b', re.IGNORECASE), "Comparison Page"),
+]
+
+
+def _guess_templates(page_title: str, limit: int = 2) -> List[str]:
+    """
+    Return up to limit likely templates for a page from its title, most likely first.
+    
+    Only called when _heuristic_template found no match for the URL (a URL match
+    skips detection entirely), so the title is the only signal left.
+    """
+    guesses = []
+    for pattern, template_name in _TITLE_TEMPLATE_RULES:
+        if template_name not in guesses and pattern.search(page_title):
+            guesses.append(template_name)
+    return guesses[:limit]
+
+
+def _prepare_body_page(body_image_path: Path, body_html_path: Path, url: str = "") -> Dict[str, str]:
+    """
+    Load and preprocess everything the body prompts need from one page.
+    
+    analyze_body_elements prepares each page once and passes the result to every
+    analysis step, so files are read, the image encoded and the HTML processed
+    only once per page.
+    
+    Returns:
+        Dictionary with "image_url" (data URL), "html_content" (raw HTML),
+        "raw_html" (first 48KB chunk of the raw HTML), "processed_html" (outline
+        of the preprocessed HTML, see _distill_html) and "page_title"
+    """
+    print("    > Loading body image and HTML content...", file=sys.stderr)
+    body_image_url = _encode_image_to_data_url(body_image_path)
+    html_content = _load_html_content(body_html_path)
+    
+    processed_html = _distill_html(_preprocess_body_html_for_analysis(html_content, url))
+    print(f"    > Distilled body HTML into a {format(len(processed_html), ',')} char outline", file=sys.stderr)
+    
+    return {
+        "image_url": body_image_url,
+        "html_content": html_content,
+        "raw_html": _chunk_html_content(html_content, 48000)[0],
+        "processed_html": processed_html,
+        "page_title": _extract_page_title(html_content)
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _build_template_checklists() -> str:
+    """Format the feature checklist of every body template for the combined analysis prompts."""
+    features_text_by_name = _get_template_index()[2]
+    return "\n\n".join(
+        f"{name}:\n" + features_text_by_name.get(name, "").rstrip("\n") for name in BODY_TEMPLATE_NAMES
+    )
+
+
+async def analyze_body_template(body_image_path: Path, body_html_path: Path, url: str = "",
+                                prepared_page: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Detect the body template and check its standard features in a single AI call.
+    
+    The prompt carries the feature checklist of every body template, so the model
+    picks the template and fills in that template's features in one response. The
+    screenshot and HTML are uploaded once instead of once per step.
+    
+    Args:
+        body_image_path: Path to the body image file
+        body_html_path: Path to the body HTML file
+        url: URL of the page for context
+        prepared_page: Output of _prepare_body_page, to skip reloading the page
+        
+    Returns:
+        Dictionary with "template_detection" (same shape as detect_body_template)
+        and "template_analysis" (same shape as analyze_template_features)
+    """
+    client = _get_client()
     
-    # Create processed HTML with absolute URLs
-    processed_html = html_content
+    try:
+        checklists = _build_template_checklists()
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Failed to load ecommerce dictionary: {str(e)}",
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url
+        }
+    
+    page = prepared_page or _prepare_body_page(body_image_path, body_html_path, url)
+    body_image_url = page["image_url"]
+    processed_html = page["processed_html"]
+    page_title = page["page_title"]
     
-    # Replace relative URLs with absolute URLs in the HTML
-    if base_url:
-        for i, original_link in enumerate(href_links):
-            if i < len(absolute_links) and original_link != absolute_links[i]:
-                processed_html = processed_html.replace(f'href="{original_link}"', f'href="{absolute_links[i]}"')
+    system_prompt = (
+        "You are an expert web template analyst. Analyze the provided body image, HTML content, "
+        "URL, and page title to determine what type of ecommerce page template this represents, "
+        "then determine which of that template's features are present. "
+        "Respond with valid JSON only."
+    )
+    instructions = _render_instructions(
+        _TEMPLATE_ANALYSIS_INSTRUCTIONS, template_names=_TEMPLATE_NAME_LIST, checklists=checklists
+    )
+    page_text = _TEMPLATE_DETECTION_PAGE.format(url=url, page_title=page_title, processed_html=processed_html)
     
-    return processed_html
+    print("    > Sending request to GPT-5 for template detection and feature analysis...", file=sys.stderr)
+    try:
+        analysis_data, raw_text = await _request_analysis(
+            client, system_prompt, instructions, page_text, body_image_url,
+            json_schema_format("template_analysis", TEMPLATE_ANALYSIS_SCHEMA)
+        )
+        
+        if not analysis_data:
+            print("    > ERROR: Template analysis failed to extract structured data", file=sys.stderr)
+            raise Exception(f"Failed to extract valid JSON from AI response. Raw response: {raw_text[:500]}")
+        
+        template_name = analysis_data.get('template_name', 'Unknown')
+        confidence = analysis_data.get('confidence_score', 0)
+        if not isinstance(confidence, int) or confidence < 0 or confidence > 3:
+            print(f"    > Warning: Invalid confidence score {confidence}, defaulting to 0", file=sys.stderr)
+            confidence = 0
+        features = analysis_data.get('features', [])
+        found_count = sum(1 for f in features if f.get('found') == 'yes')
+        
+        print(f"    > Template analysis complete: {template_name} (confidence: {confidence}/3), {found_count}/{len(features)} features found", file=sys.stderr)
+        
+        template_data = _get_template_index()[0].get(template_name.lower(), {})
+        return {
+            "success": True,
+            "template_detection": {
+                "success": True,
+                "template_name": template_name,
+                "confidence_score": confidence,
+                "justification": analysis_data.get('justification', 'No justification provided'),
+                "url_indicators": analysis_data.get('url_indicators', ''),
+                "content_indicators": analysis_data.get('content_indicators', ''),
+                "raw_response": raw_text,
+                "image_path": str(body_image_path),
+                "html_path": str(body_html_path),
+                "url": url,
+                "page_title": page_title
+            },
+            "template_analysis": {
+                "name": template_name,
+                "description": template_data.get('description', ''),
+                "features": features
+            },
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url,
+            "raw_response": raw_text
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Template analysis failed: {str(e)}",
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url
+        }
 
 
-async def detect_body_template(body_image_path: Path, body_html_path: Path, url: str = "") -> Dict[str, Any]:
+async def detect_body_template(body_image_path: Path, body_html_path: Path, url: str = "",
+                               prepared_page: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Detect what template type the body content represents using AI analysis.
     
@@ -189,126 +1049,54 @@ async def detect_body_template(body_image_path: Path, body_html_path: Path, url:
         body_image_path: Path to the body image file
         body_html_path: Path to the body HTML file
         url: URL of the page for context
+        prepared_page: Output of _prepare_body_page, to skip reloading the page
         
     Returns:
         Dictionary containing template detection results with confidence score
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
-    
-    # Load and encode the body image
-    print("    > Loading body image for template detection...", file=sys.stderr)
-    body_b64 = _encode_image_to_base64(body_image_path)
-    
-    # Load and preprocess HTML content with chunking
-    print("    > Processing body HTML content for template detection...", file=sys.stderr)
-    html_content = _load_html_content(body_html_path)
-    processed_html = _preprocess_body_html_for_analysis(html_content, url)
+    # Unambiguous URLs are classified without an API call
+    heuristic = _heuristic_template(url)
+    if heuristic:
+        template_name, path = heuristic
+        print(f"    > Template detected from URL: {template_name} (confidence: 3/3)", file=sys.stderr)
+        page_title = prepared_page["page_title"] if prepared_page else _extract_page_title(_load_html_content(body_html_path))
+        return {
+            "success": True,
+            "template_name": template_name,
+            "confidence_score": 3,
+            "justification": f"The URL path '{path}' is a standard {template_name} URL pattern.",
+            "url_indicators": path,
+            "content_indicators": "",
+            "raw_response": "",
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url,
+            "page_title": page_title
+        }
     
-    # Use chunking for large HTML content (48KB chunks)
-    html_chunks = _chunk_html_content(processed_html, 48000)
-    print(f"    > Split HTML into {len(html_chunks)} chunks for analysis", file=sys.stderr)
+    client = _get_client()
     
-    # Use the first chunk for template detection (usually contains key indicators)
-    processed_html = html_chunks[0]
+    page = prepared_page or _prepare_body_page(body_image_path, body_html_path, url)
+    body_image_url = page["image_url"]
+    processed_html = page["processed_html"]
+    page_title = page["page_title"]
     
-    # Extract page title from HTML if available
-    page_title = ""
-    try:
-        import re
-        title_match = re.search(r'<title[^>]*>(.*?)</title>', html_content, re.IGNORECASE | re.DOTALL)
-        if title_match:
-            page_title = title_match.group(1).strip()
-    except:
-        pass
+    system_prompt = (
+        "You are an expert web template analyst. Analyze the provided body image, HTML content, "
+        "URL, and page title to determine what type of ecommerce page template this represents. "
+        "Consider the layout, content structure, and URL patterns to make your determination. "
+        "Respond with valid JSON only."
+    )
+    page_text = _TEMPLATE_DETECTION_PAGE.format(url=url, page_title=page_title, processed_html=processed_html)
     
     print("    > Sending request to GPT-5 for template detection...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert web template analyst. Analyze the provided body image, HTML content, "
-                        "URL, and page title to determine what type of ecommerce page template this represents. "
-                        "Consider the layout, content structure, and URL patterns to make your determination. "
-                        "Respond with valid JSON only."
-                    )
-                },
-                {
-                    "role": "user", 
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"""
-Please analyze this website body content and determine what template type it represents.
-
-Website URL: {url}
-Page Title: {page_title}
-
-Body HTML Content:
-{processed_html}
-
-Available template types (use exact names):
-- Homepage
-- Category Page  
-- Search Results
-- Product Detail
-- Cart
-- Checkout
-- My Account
-- Wishlist
-- Comparison Page
-- Store Locator
-- Contact Us
-- Gift Registry
-- Content
-
-CONFIDENCE SCORING:
-- 0: No confidence - Cannot determine template type
-- 1: Low confidence - Some indicators but unclear
-- 2: Medium confidence - Clear indicators present
-- 3: High confidence - Very clear indicators (e.g., URL is domain root = Homepage)
-
-ANALYSIS CRITERIA:
-- URL patterns (e.g., "/" = Homepage, "/category/" = Category Page, "/product/" = Product Detail)
-- Page title content
-- Visual layout and structure from image
-- HTML content structure and elements
-- Presence of specific UI components
-
-Return your analysis as a JSON object with this structure:
-{{
-  "template_name": "Template name from the list above",
-  "confidence_score": 0-3,
-  "justification": "One sentence explaining why you chose this template and confidence level",
-  "url_indicators": "URL patterns that influenced the decision",
-  "content_indicators": "Content/layout elements that influenced the decision"
-}}
-"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{body_b64}"
-                            }
-                        }
-                    ]
-                }
-            ]
+        detection_data, raw_text = await _request_analysis(
+            client, system_prompt, _TEMPLATE_DETECTION_INSTRUCTIONS, page_text, body_image_url,
+            json_schema_format("template_detection", TEMPLATE_DETECTION_SCHEMA)
         )
         
         print("    > Processing template detection response...", file=sys.stderr)
-        # Extract JSON response
-        try:
-            detection_data, raw_text = _extract_json_from_response(response)
-        except Exception as e:
-            print(f"      > Error extracting response: {str(e)}", file=sys.stderr)
-            raise Exception(f"Failed to extract AI response: {str(e)}")
         
         if detection_data:
             template_name = detection_data.get('template_name', 'Unknown')
@@ -355,7 +1143,8 @@ Return your analysis as a JSON object with this structure:
         }
 
 
-async def detect_custom_features(body_image_path: Path, body_html_path: Path, template_name: str, standard_features: List[Dict], url: str = "") -> Dict[str, Any]:
+async def detect_custom_features(body_image_path: Path, body_html_path: Path, template_name: str, standard_features: List[Dict], url: str = "",
+                                 prepared_page: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Second AI call to identify custom features not in the standard template.
     
@@ -365,116 +1154,44 @@ async def detect_custom_features(body_image_path: Path, body_html_path: Path, te
         template_name: Name of the detected template
         standard_features: List of already identified standard features
         url: Base URL for context
+        prepared_page: Output of _prepare_body_page, to skip reloading the page
         
     Returns:
         Dictionary containing custom features analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
+    client = _get_client()
     
-    client = OpenAI(api_key=api_key)
-    
-    # Encode image
-    try:
-        body_b64 = _encode_image_to_base64(body_image_path)
-    except Exception as e:
-        raise Exception(f"Failed to encode body image: {str(e)}")
-    
-    # Read and process HTML with chunking
+    # Encode image and read HTML (custom features use the raw HTML)
     try:
-        with open(body_html_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        # Use chunking for large HTML content
-        html_chunks = _chunk_html_content(html_content, 48000)
-        print(f"    > Split HTML into {len(html_chunks)} chunks for custom features analysis", file=sys.stderr)
-        
-        # Use the first chunk for custom features detection
-        processed_html = html_chunks[0]
+        page = prepared_page or _prepare_body_page(body_image_path, body_html_path, url)
     except Exception as e:
-        raise Exception(f"Failed to read body HTML: {str(e)}")
+        raise Exception(f"Failed to load body page: {str(e)}")
+    body_image_url = page["image_url"]
+    processed_html = page["raw_html"]
     
     # Format standard features for the prompt
     found_features = [f"- {f['name']}: {f['description']}" for f in standard_features if f.get('found') == 'yes']
     standard_features_text = "\n".join(found_features) if found_features else "None detected"
     
+    system_prompt = (
+        f"You are an expert web UI analyst specializing in identifying unique custom features on {template_name} pages. "
+        "Your task is to find additional functionality that goes beyond standard template features. "
+        "Focus on unique widgets, custom sections, special tools, or innovative UI elements. "
+        "Respond with valid JSON only."
+    )
+    instructions = _render_instructions(_CUSTOM_FEATURES_INSTRUCTIONS, template_name=template_name)
+    page_text = _CUSTOM_FEATURES_PAGE.format(
+        url=url, processed_html=processed_html, standard_features_text=standard_features_text
+    )
+    
     print(f"    > Sending request to GPT-5-mini for custom features detection on {template_name}...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        f"You are an expert web UI analyst specializing in identifying unique custom features on {template_name} pages. "
-                        "Your task is to find additional functionality that goes beyond standard template features. "
-                        "Focus on unique widgets, custom sections, special tools, or innovative UI elements. "
-                        "Respond with valid JSON only."
-                    )
-                },
-                {
-                    "role": "user", 
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"""
-Please analyze this {template_name} page and identify CUSTOM features that are NOT in the standard template.
-
-Website URL: {url}
-
-HTML Content:
-{processed_html}
-
-STANDARD FEATURES ALREADY IDENTIFIED:
-{standard_features_text}
-
-INSTRUCTIONS:
-1. Look at the screenshot and HTML for additional functionality beyond the standard features listed above
-2. Identify unique/custom elements specific to this page or site
-3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
-4. Examples might include: Live chat widgets, product comparison tools, custom calculators, special promotional sections, unique navigation elements, custom forms, interactive elements, etc.
-5. Only return features that are clearly visible and functional in the screenshot/HTML
-6. Return 3-5 most significant custom features (if any exist)
-7. If no significant custom features are found, return an empty array
-
-NAMING REQUIREMENTS:
-- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
-- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
-
-Return your analysis as a JSON object with this structure:
-{{
-  "custom_features": [
-    {{
-      "name": "Live Chat Widget",
-      "description": "Interactive chat support tool for customer assistance."
-    }},
-    {{
-      "name": "Size Guide",
-      "description": "Pop-up sizing chart with measurements and fit recommendations."
-    }}
-  ]
-}}
-"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{body_b64}"
-                            }
-                        }
-                    ]
-                }
-            ]
+        analysis_data, raw_text = await _request_analysis(
+            client, system_prompt, instructions, page_text, body_image_url,
+            json_schema_format("custom_features", CUSTOM_FEATURES_SCHEMA)
         )
         
         print("    > Processing custom features detection response...", file=sys.stderr)
-        # Extract JSON response
-        try:
-            analysis_data, raw_text = _extract_json_from_response(response)
-        except Exception as e:
-            print(f"      > Error extracting response: {str(e)}", file=sys.stderr)
-            raise Exception(f"Failed to extract AI response: {str(e)}")
         
         if analysis_data:
             custom_features = analysis_data.get('custom_features', [])
@@ -505,7 +1222,8 @@ Return your analysis as a JSON object with this structure:
         }
 
 
-async def analyze_template_features(body_image_path: Path, body_html_path: Path, template_name: str, url: str = "") -> Dict[str, Any]:
+async def analyze_template_features(body_image_path: Path, body_html_path: Path, template_name: str, url: str = "",
+                                    prepared_page: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Analyze body content against a specific template to identify features.
     
@@ -514,62 +1232,21 @@ async def analyze_template_features(body_image_path: Path, body_html_path: Path,
         body_html_path: Path to the body HTML file
         template_name: Name of the template to analyze against
         url: Base URL for context
+        prepared_page: Output of _prepare_body_page, to skip reloading the page
         
     Returns:
         Dictionary containing template feature analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    client = _get_client()
     
     # Load the ecommerce dictionary to get template features
     print(f"    > Loading template features for {template_name}...", file=sys.stderr)
     try:
-        script_dir = Path(__file__).parent
-        dict_path = script_dir / "ecommerce_dictionary.json"
-        
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            ecommerce_dict = json.load(f)
-        
-        # Find the template with robust matching
-        template_data = None
-        templates = ecommerce_dict.get('templates', [])
-        
-        # First try exact match (case insensitive)
-        for template in templates:
-            if template.get('name', '').lower() == template_name.lower():
-                template_data = template
-                break
-        
-        # If no exact match, try partial matching (for robustness)
-        if not template_data:
-            for template in templates:
-                template_name_clean = template.get('name', '').lower().replace(' template', '')
-                if template_name_clean == template_name.lower():
-                    template_data = template
-                    break
-        
-        # If still no match, try fuzzy matching on key words
-        if not template_data:
-            template_name_words = set(template_name.lower().split())
-            best_match = None
-            best_score = 0
-            
-            for template in templates:
-                template_words = set(template.get('name', '').lower().replace(' template', '').split())
-                common_words = template_name_words.intersection(template_words)
-                if len(common_words) > best_score:
-                    best_score = len(common_words)
-                    best_match = template
-            
-            if best_match and best_score > 0:
-                template_data = best_match
-                print(f"    > Using fuzzy match: '{template_name}' -> '{template_data.get('name')}'", file=sys.stderr)
+        template_data = _find_template(template_name)
         
         if not template_data:
-            raise Exception(f"Template '{template_name}' not found in ecommerce dictionary. Available templates: {[t.get('name') for t in templates]}")
+            available_templates = [t.get('name') for t in _load_ecommerce_dictionary().get('templates', [])]
+            raise Exception(f"Template '{template_name}' not found in ecommerce dictionary. Available templates: {available_templates}")
             
     except Exception as e:
         return {
@@ -578,97 +1255,35 @@ async def analyze_template_features(body_image_path: Path, body_html_path: Path,
             "template_name": template_name
         }
     
-    # Load and encode the body image
-    print("    > Loading body image for feature analysis...", file=sys.stderr)
-    body_b64 = _encode_image_to_base64(body_image_path)
-    
-    # Load and preprocess HTML content with chunking
-    print("    > Processing body HTML content for feature analysis...", file=sys.stderr)
-    html_content = _load_html_content(body_html_path)
-    processed_html = _preprocess_body_html_for_analysis(html_content, url)
-    
-    # Use chunking for large HTML content (48KB chunks)
-    html_chunks = _chunk_html_content(processed_html, 48000)
-    print(f"    > Split HTML into {len(html_chunks)} chunks for feature analysis", file=sys.stderr)
-    
+    page = prepared_page or _prepare_body_page(body_image_path, body_html_path, url)
+    body_image_url = page["image_url"]
     # For feature analysis, we'll analyze the first chunk (most important content)
     # TODO: Could be enhanced to analyze multiple chunks and merge results
-    processed_html = html_chunks[0]
+    processed_html = page["processed_html"]
+    
+    # Precomputed feature list for analysis
+    features_text = _get_template_index()[2].get(template_data.get('name', ''), "")
     
-    # Build feature list for analysis
-    features_text = ""
-    for i, feature in enumerate(template_data.get('features', []), 1):
-        features_text += f"{i}. {feature.get('name', 'Unknown')}: {feature.get('description', 'No description')}\n"
+    system_prompt = (
+        f"You are an expert web UI analyst specializing in {template_name} pages. "
+        "Analyze the provided image and HTML to determine which template features are present. "
+        "Look carefully at both the visual elements in the image and the HTML structure. "
+        "Respond with valid JSON only."
+    )
+    instructions = _render_instructions(
+        _TEMPLATE_FEATURES_INSTRUCTIONS, template_name=template_name,
+        template_description=template_data.get('description', ''), features_text=features_text
+    )
+    page_text = _TEMPLATE_FEATURES_PAGE.format(url=url, processed_html=processed_html)
     
     print(f"    > Sending request to GPT-5 for {template_name} feature analysis...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        f"You are an expert web UI analyst specializing in {template_name} pages. "
-                        "Analyze the provided image and HTML to determine which template features are present. "
-                        "Look carefully at both the visual elements in the image and the HTML structure. "
-                        "Respond with valid JSON only."
-                    )
-                },
-                {
-                    "role": "user", 
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"""
-Please analyze this {template_name} page and determine which features are present.
-
-Website URL: {url}
-
-HTML Content:
-{processed_html}
-
-Template Features to Check:
-{features_text}
-
-INSTRUCTIONS:
-1. Look at the body image to identify visual elements
-2. Cross-reference with the HTML code provided
-3. For each feature listed above, determine if it's present ("yes") or not present ("no")
-4. Base your decision on both visual evidence from the image AND HTML structure
-5. Be thorough but conservative - only mark "yes" if you can clearly see evidence
-
-Return your analysis as a JSON object with this structure:
-{{
-  "name": "{template_name}",
-  "description": "{template_data.get('description', '')}",
-  "features": [
-    {{
-      "name": "Feature Name",
-      "description": "Feature Description", 
-      "found": "yes" or "no"
-    }}
-  ]
-}}
-"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{body_b64}"
-                            }
-                        }
-                    ]
-                }
-            ]
+        analysis_data, raw_text = await _request_analysis(
+            client, system_prompt, instructions, page_text, body_image_url,
+            json_schema_format("template_features", TEMPLATE_FEATURES_SCHEMA)
         )
         
         print("    > Processing feature analysis response...", file=sys.stderr)
-        # Extract JSON response
-        try:
-            analysis_data, raw_text = _extract_json_from_response(response)
-        except Exception as e:
-            print(f"      > Error extracting response: {str(e)}", file=sys.stderr)
-            raise Exception(f"Failed to extract AI response: {str(e)}")
         
         if analysis_data:
             features = analysis_data.get('features', [])
@@ -700,6 +1315,13 @@ Return your analysis as a JSON object with this structure:
         }
 
 
+async def _cancel_tasks(tasks: List[asyncio.Task]) -> None:
+    """Cancel tasks and wait for them to finish, so none is left pending with an unretrieved exception."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url: str = "") -> Dict[str, Any]:
     """
     Analyze body image and HTML with template detection and feature analysis.
@@ -712,10 +1334,34 @@ async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url
     Returns:
         Dictionary containing analysis results with template detection and features
     """
+    speculative_features: Dict[str, asyncio.Task] = {}
     try:
-        # Step 1: Detect template type
-        print("  > Step 1: Detecting template type...", file=sys.stderr)
-        template_detection = await detect_body_template(body_image_path, body_html_path, url)
+        # Read the files, encode the image and preprocess the HTML once for all steps
+        page = _prepare_body_page(body_image_path, body_html_path, url)
+        
+        combined_analysis: Dict[str, Any] = {}
+        if _heuristic_template(url):
+            # Step 1: The URL identifies the template, so detection needs no API call
+            print("  > Step 1: Detecting template type from URL...", file=sys.stderr)
+            template_detection = await detect_body_template(body_image_path, body_html_path, url, prepared_page=page)
+        else:
+            # Step 1: Detect template type and check its features in one call
+            print("  > Step 1: Detecting template type and features...", file=sys.stderr)
+            combined_analysis = await analyze_body_template(body_image_path, body_html_path, url, prepared_page=page)
+            
+            if combined_analysis.get("success", False):
+                template_detection = combined_analysis["template_detection"]
+            else:
+                # Fall back to the separate detection call, speculatively analyzing the features of the
+                # likeliest templates meanwhile (not in batch mode, where requests wait for the whole batch)
+                print(f"  > Combined template analysis failed ({combined_analysis.get('error', 'Unknown error')}) - falling back to separate calls", file=sys.stderr)
+                if _batch_dispatcher.get() is None:
+                    for guess in _guess_templates(page["page_title"]):
+                        print(f"  > Speculatively analyzing {guess} features...", file=sys.stderr)
+                        speculative_features[guess] = asyncio.create_task(
+                            analyze_template_features(body_image_path, body_html_path, guess, url, prepared_page=page)
+                        )
+                template_detection = await detect_body_template(body_image_path, body_html_path, url, prepared_page=page)
         
         if not template_detection.get("success", False):
             return {
@@ -730,6 +1376,11 @@ async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url
         confidence_score = template_detection.get("confidence_score", 0)
         justification = template_detection.get("justification", "No justification provided")
         
+        # Stop speculative feature analyses for templates that were not detected, so their
+        # streamed requests are closed now instead of running to completion
+        await _cancel_tasks([speculative_features.pop(guess) for guess in list(speculative_features)
+                             if guess != template_name or confidence_score <= 1])
+        
         # Step 2: Check confidence level
         if confidence_score <= 1:
             print(f"  > Low confidence ({confidence_score}/3) - returning template not known", file=sys.stderr)
@@ -745,9 +1396,17 @@ async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url
                 "url": url
             }
         
-        # Step 3: Perform template-specific feature analysis
-        print(f"  > Step 2: Analyzing {template_name} features (confidence: {confidence_score}/3)...", file=sys.stderr)
-        feature_analysis = await analyze_template_features(body_image_path, body_html_path, template_name, url)
+        # Step 3: Use the combined feature results, or run the template-specific analysis
+        # when the combined call failed or came back without features
+        if combined_analysis.get("success", False) and combined_analysis["template_analysis"]["features"]:
+            feature_analysis = combined_analysis
+        elif template_name in speculative_features:
+            print(f"  > Step 2: Using speculative {template_name} feature analysis...", file=sys.stderr)
+            feature_analysis = await speculative_features.pop(template_name)
+        else:
+            print(f"  > Step 2: Analyzing {template_name} features (confidence: {confidence_score}/3)...", file=sys.stderr)
+            feature_analysis = await analyze_template_features(body_image_path, body_html_path, template_name, url,
+                                                               prepared_page=page)
         
         if not feature_analysis.get("success", False):
             return {
@@ -762,7 +1421,8 @@ async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url
         # Step 4: Detect custom features not in the standard template
         print(f"  > Step 3: Detecting custom features for {template_name}...", file=sys.stderr)
         standard_features = feature_analysis.get("template_analysis", {}).get("features", [])
-        custom_features_analysis = await detect_custom_features(body_image_path, body_html_path, template_name, standard_features, url)
+        custom_features_analysis = await detect_custom_features(body_image_path, body_html_path, template_name,
+                                                                standard_features, url, prepared_page=page)
         
         # Combine results (include custom features even if detection failed)
         result = {
@@ -796,3 +1456,202 @@ async def analyze_body_elements(body_image_path: Path, body_html_path: Path, url
             "html_path": str(body_html_path),
             "url": url
         }
+    finally:
+        # Drop any speculative feature analyses that are still running (e.g. after a failed detection)
+        await _cancel_tasks(list(speculative_features.values()))
+
+
+async def analyze_many(items: List[Tuple[Path, Path, str]], concurrency: int = 10,
+                       rpm: Optional[int] = 500) -> List[Any]:
+    """
+    Analyze many pages concurrently with analyze_body_elements.
+    
+    At most `concurrency` pages are in flight at once, and their GPT calls
+    share a token bucket of `rpm` requests per minute, so large crawls are
+    throttled up front instead of running into rate-limit retries. N pages take
+    roughly ceil(N / concurrency) round trips instead of N.
+    
+    Args:
+        items: List of (body_image_path, body_html_path, url) tuples
+        concurrency: Maximum number of pages analyzed at the same time
+        rpm: Maximum GPT requests per minute across all pages, or None for no limit
+        
+    Returns:
+        List of analysis results in input order; an exception object takes the
+        place of any page whose analysis raised
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def analyze_one(body_image_path: Path, body_html_path: Path, url: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await analyze_body_elements(body_image_path, body_html_path, url)
+    
+    token = _rate_limiter.set(RateLimiter(rpm) if rpm else None)
+    try:
+        return await asyncio.gather(*[analyze_one(*item) for item in items], return_exceptions=True)
+    finally:
+        _rate_limiter.reset(token)
+
+
+async def analyze_body_elements_batched(pages: List[Tuple[Path, Path, str]], poll_interval: int = 60) -> List[Dict[str, Any]]:
+    """
+    Analyze many pages through the OpenAI Batch API instead of real-time calls.
+    
+    Each analysis step (template analysis, custom features) is submitted as one
+    batch covering every page still in progress. Batch jobs cost about half as
+    much but may take up to 24 hours, so this is intended for bulk,
+    non-interactive crawls; use analyze_body_elements otherwise.
+    
+    Args:
+        pages: List of (body_image_path, body_html_path, url) tuples
+        poll_interval: Seconds to wait between batch status checks
+        
+    Returns:
+        List of analysis results in the same order and shape as analyze_body_elements
+    """
+    dispatcher = BatchDispatcher(_get_client(), len(pages), poll_interval)
+    
+    async def run_page(body_image_path: Path, body_html_path: Path, url: str) -> Dict[str, Any]:
+        try:
+            return await analyze_body_elements(body_image_path, body_html_path, url)
+        finally:
+            dispatcher.pipeline_finished()
+    
+    token = _batch_dispatcher.set(dispatcher)
+    try:
+        return await asyncio.gather(*[run_page(*page) for page in pages])
+    finally:
+        _batch_dispatcher.reset(token)
+
+
+async def analyze_body_elements_packed(pages: List[Tuple[Path, Path, str]], pages_per_request: int = 4,
+                                       max_html_chars: int = 4000) -> List[Dict[str, Any]]:
+    """
+    Analyze several pages per GPT call by packing them into a single request.
+    
+    Each request carries the shared instructions and template checklists once,
+    followed by every page's URL, title, truncated HTML and screenshot, and
+    returns template detection, features and custom features for all of them.
+    This amortizes the prompt tokens and round trips over the group, at the cost
+    of less HTML context per page than analyze_body_elements.
+    
+    Args:
+        pages: List of (body_image_path, body_html_path, url) tuples
+        pages_per_request: Maximum number of pages packed into one request
+        max_html_chars: Maximum length of each page's HTML outline
+        
+    Returns:
+        List of analysis results in the same order and shape as analyze_body_elements
+    """
+    client = _get_client()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(pages)
+    
+    def page_error(index: int, error: str) -> Dict[str, Any]:
+        body_image_path, body_html_path, url = pages[index]
+        return {
+            "success": False,
+            "error": error,
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url
+        }
+    
+    try:
+        checklists = _build_template_checklists()
+        templates_by_name = _get_template_index()[0]
+    except Exception as e:
+        return [page_error(i, f"Failed to load ecommerce dictionary: {str(e)}") for i in range(len(pages))]
+    
+    system_prompt = (
+        "You are an expert web template analyst. For each provided page, analyze its body image, HTML content, "
+        "URL, and page title to determine what type of ecommerce page template it represents, which of that "
+        "template's features are present, and which custom features it adds. "
+        "Respond with valid JSON only."
+    )
+    instructions = _render_instructions(
+        _PACKED_ANALYSIS_INSTRUCTIONS, template_names=_TEMPLATE_NAME_LIST, checklists=checklists
+    )
+    
+    # Prepare every page once; pages that cannot be read fail individually
+    prepared: List[Tuple[int, str, str]] = []
+    for index, (body_image_path, body_html_path, url) in enumerate(pages):
+        try:
+            image_url = _encode_image_to_data_url(body_image_path)
+            html_content = _load_html_content(body_html_path)
+            processed_html = _distill_html(_preprocess_body_html_for_analysis(html_content, url), max_html_chars)
+            page_text = _PACKED_ANALYSIS_PAGE.format(
+                page_id=index, url=url, page_title=_extract_page_title(html_content), processed_html=processed_html
+            )
+            prepared.append((index, page_text, image_url))
+        except Exception as e:
+            results[index] = page_error(index, f"Failed to prepare page: {str(e)}")
+    
+    def page_result(index: int, page_data: Dict[str, Any], raw_text: str) -> Dict[str, Any]:
+        body_image_path, body_html_path, url = pages[index]
+        template_name = page_data.get('template_name', 'Unknown')
+        confidence = page_data.get('confidence_score', 0)
+        justification = page_data.get('justification', 'No justification provided')
+        template_detection = {
+            "success": True,
+            "template_name": template_name,
+            "confidence_score": confidence,
+            "justification": justification,
+            "url_indicators": page_data.get('url_indicators', ''),
+            "content_indicators": page_data.get('content_indicators', ''),
+            "raw_response": raw_text,
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url
+        }
+        result = {
+            "success": True,
+            "template_detection": template_detection,
+            "template_name": template_name,
+            "confidence_score": confidence,
+            "justification": justification,
+            "image_path": str(body_image_path),
+            "html_path": str(body_html_path),
+            "url": url
+        }
+        if confidence <= 1:
+            result["template_not_known"] = True
+            return result
+        
+        result["template_analysis"] = {
+            "name": template_name,
+            "description": templates_by_name.get(template_name.lower(), {}).get('description', ''),
+            "features": page_data.get('features', [])
+        }
+        result["custom_features"] = page_data.get('custom_features', [])
+        result["raw_response"] = raw_text
+        return result
+    
+    async def analyze_group(group: List[Tuple[int, str, str]]) -> None:
+        print(f"    > Sending packed request to GPT-5 for {len(group)} pages...", file=sys.stderr)
+        try:
+            analysis_data, raw_text = await _request_analysis(
+                client, system_prompt, instructions,
+                [page_text for _, page_text, _ in group], [image_url for _, _, image_url in group],
+                json_schema_format("packed_analysis", PACKED_ANALYSIS_SCHEMA)
+            )
+            if not analysis_data:
+                raise Exception(f"Failed to extract valid JSON from AI response. Raw response: {raw_text[:500]}")
+        except Exception as e:
+            for index, _, _ in group:
+                results[index] = page_error(index, f"Packed body analysis failed: {str(e)}")
+            return
+        
+        pages_by_id = {str(page_data.get('id')): page_data for page_data in analysis_data.get('pages', [])}
+        for index, _, _ in group:
+            page_data = pages_by_id.get(str(index))
+            if page_data is None:
+                results[index] = page_error(index, "Packed body analysis returned no result for this page")
+            else:
+                results[index] = page_result(index, page_data, raw_text)
+    
+    groups = [prepared[i:i + pages_per_request] for i in range(0, len(prepared), pages_per_request)]
+    await asyncio.gather(*[analyze_group(group) for group in groups])
+    
+    succeeded = sum(1 for r in results if r and r.get("success"))
+    print(f"    > Packed body analysis complete: {succeeded}/{len(pages)} pages succeeded", file=sys.stderr)
+    return results
@@ -7,71 +7,155 @@ template to identify which features are present or absent.
 
 import os
 import sys
-import base64
 import json
-import re
+import asyncio
+import functools
+import contextvars
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
-from dotenv import load_dotenv
-from openai import OpenAI
+from typing import Dict, List, Any, Optional, Tuple, Union
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+try:
+    from .utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision,
+                        PNG_DATA_URL_PREFIX, minify_html_for_llm, iter_json_objects, read_streamed_json)
+    from .response_cache import response_cache, make_cache_key, file_digest
+    from .batch import BatchDispatcher
+except ImportError:
+    # Run directly as a script, outside the ai_analysis package
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ai_analysis.utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision,
+                                   PNG_DATA_URL_PREFIX, minify_html_for_llm, iter_json_objects, read_streamed_json)
+    from ai_analysis.response_cache import response_cache, make_cache_key, file_digest
+    from ai_analysis.batch import BatchDispatcher
 
-# Load environment variables
-load_dotenv()
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Part of the response cache key; bump when the footer prompt changes so stale analyses are not reused
+_FOOTER_PROMPT_VERSION = "footer-v2"
+
+# Template dictionary; its content digest is also part of the response cache key
+_DICTIONARY_PATH = Path(__file__).parent / "ecommerce_dictionary.json"
+
+# Full model replies are only kept in results when FOOTER_ANALYZER_DEBUG_RAW=1; otherwise just their length,
+# so callers collecting many results don't hold (and re-serialize) every raw reply
+DEBUG_RAW = os.getenv("FOOTER_ANALYZER_DEBUG_RAW") == "1"
+
+# Retries for transient errors (429, 408/409, 5xx, connection failures), done by the SDK with exponential backoff
+_MAX_RETRIES = 4
+
+# Set by analyze_footer_elements_batched to route GPT calls through the Batch API
+_batch_dispatcher: contextvars.ContextVar[Optional[BatchDispatcher]] = contextvars.ContextVar("_batch_dispatcher", default=None)
 
 
 def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
-    """Extract JSON from GPT-4 Chat Completions API output with robust error handling."""
+    """Extract JSON from GPT-4 Chat Completions API output (or its raw text) with robust error handling."""
     data = None
     
     # Extract text from chat completions response
-    try:
-        raw_text = resp.choices[0].message.content.strip()
-    except (AttributeError, IndexError):
-        raw_text = str(resp)
+    if isinstance(resp, str):
+        raw_text = resp.strip()
+    else:
+        try:
+            raw_text = resp.choices[0].message.content.strip()
+        except (AttributeError, IndexError):
+            raw_text = str(resp)
     
     # Try to extract JSON from the response
     try:
-        # First, try to parse the entire response as JSON
-        data = json.loads(raw_text)
+        # First, try to parse the entire response as JSON (the normal case in JSON mode)
+        data = _json_loads(raw_text)
     except json.JSONDecodeError:
-        # If that fails, try to find JSON within code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
-        if json_match:
+        # If that fails, try each balanced {...} object in the text, e.g. inside a code block
+        for candidate_json in iter_json_objects(raw_text):
             try:
-                data = json.loads(json_match.group(1))
+                data = _json_loads(candidate_json)
+                break
             except json.JSONDecodeError:
-                pass
-        
-        # If still no luck, try to find any JSON-like structure
-        if data is None:
-            json_match = re.search(r'(\{.*\})', raw_text, re.DOTALL)
-            if json_match:
-                try:
-                    data = json.loads(json_match.group(1))
-                except json.JSONDecodeError:
-                    pass
+                continue
     
     return data, raw_text
 
 
-def _encode_image_to_base64(image_path: Path) -> str:
-    """Encode an image file to base64 string."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def _raw_response_fields(raw_text: str) -> Dict[str, Any]:
+    """Result fields describing the raw model reply: the text itself in debug mode, else its length."""
+    if DEBUG_RAW:
+        return {"raw_response": raw_text}
+    return {"raw_response_len": len(raw_text)}
+
+
+def _encode_image_to_data_url(image_path: Path) -> str:
+    """Encode a footer screenshot as a data URL, cached by path, modification time and size."""
+    stat = image_path.stat()
+    return _cached_image_data_url(str(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_image_data_url(image_path: str, mtime_ns: int, size: int) -> str:
+    """Encode the image at image_path as a data URL; mtime_ns and size only key the cache."""
+    path = Path(image_path)
+    try:
+        # Downscaled to what the vision model uses and re-encoded as WebP when that is smaller
+        data_url = encode_image_for_vision(path)
+        if data_url:
+            return data_url
+    except (OSError, ValueError) as e:
+        print(f"    > Warning: Could not re-encode {path.name} for vision ({e}), sending original image", file=sys.stderr)
+    return encode_image_to_base64(path, prefix=PNG_DATA_URL_PREFIX)
+
+
+async def _create_completion(client: AsyncOpenAI, **request_body) -> Union[ChatCompletion, str]:
+    """
+    Send a chat completion request through the active batch dispatcher if there
+    is one, otherwise in real time with the SDK retrying transient errors.
+    
+    Real-time replies are streamed and reading stops as soon as the JSON object
+    is complete (see read_streamed_json), so the reply text is returned instead
+    of a ChatCompletion; _extract_json_from_response accepts either.
+    """
+    dispatcher = _batch_dispatcher.get()
+    if dispatcher is not None:
+        return ChatCompletion.model_validate(await dispatcher.complete(request_body))
+    stream = await client.with_options(max_retries=_MAX_RETRIES).chat.completions.create(**request_body, stream=True)
+    return await read_streamed_json(stream)
 
 
 def _load_html_content(html_path: Path) -> str:
     """Load HTML content from file."""
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return html_path.read_text(encoding="utf-8")
+
+
+# Footer HTML budget in tokens, converted to characters at a conservative ~4 characters per token
+FOOTER_HTML_MAX_TOKENS = 6000
+_CHARS_PER_TOKEN = 4
+
+
+def _prepare_footer_html(html_content: str) -> str:
+    """Minify footer HTML and truncate it to roughly FOOTER_HTML_MAX_TOKENS tokens."""
+    return minify_html_for_llm(html_content)[:FOOTER_HTML_MAX_TOKENS * _CHARS_PER_TOKEN]
+
+
+def _prepare_footer_page(footer_image_path: Path, footer_html_path: Path) -> Dict[str, str]:
+    """
+    Load everything the footer prompts need from disk once.
+    
+    Returns:
+        Dictionary with "image_url" (screenshot data URL) and "html_content"
+        (minified, truncated footer HTML)
+    """
+    return {
+        "image_url": _encode_image_to_data_url(footer_image_path),
+        "html_content": _prepare_footer_html(_load_html_content(footer_html_path))
+    }
 
 
+@functools.lru_cache(maxsize=1)
 def load_footer_template() -> dict:
-    """Load the Footer Template section from ecommerce_dictionary.json"""
+    """Load the Footer Template section from ecommerce_dictionary.json (cached; treat as read-only)"""
     try:
-        dict_path = Path(__file__).parent / "ecommerce_dictionary.json"
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _json_loads(_DICTIONARY_PATH.read_bytes())
         
         # Find the Footer Template
         for template in data.get("templates", []):
@@ -83,38 +167,167 @@ def load_footer_template() -> dict:
         raise Exception(f"Failed to load footer template: {str(e)}")
 
 
-async def detect_custom_features(footer_image_path: Path, footer_html_path: Path, standard_features: List[Dict], url: str = "") -> Dict[str, Any]:
+@functools.lru_cache(maxsize=1)
+def _footer_template_json() -> str:
+    """Footer template serialized for the prompt, built once per process."""
+    return json.dumps(load_footer_template(), indent=2)
+
+
+# Prompts are kept as module constants with <<SLOT>> placeholders filled by str.replace at call
+# time; the page HTML is always substituted last so its content is never scanned for placeholders
+_CUSTOM_FEATURES_SYSTEM_PROMPT = (
+    "You are an expert web UI analyst specializing in identifying unique custom features in website footers. "
+    "Your task is to find additional functionality that goes beyond standard footer template features. "
+    "Focus on unique widgets, custom sections, special tools, or innovative UI elements in the footer area. "
+    "Respond with valid JSON only."
+)
+
+_CUSTOM_FEATURES_PROMPT = """
+Please analyze this website footer and identify CUSTOM features that are NOT in the standard footer template.
+
+Website URL: <<URL>>
+
+HTML Content:
+<<HTML>>
+
+STANDARD FOOTER FEATURES ALREADY IDENTIFIED:
+<<STANDARD_FEATURES>>
+
+INSTRUCTIONS:
+1. Look at the footer screenshot and HTML for additional functionality beyond the standard features listed above
+2. Identify unique/custom elements specific to this footer or site
+3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
+4. Examples might include: Custom newsletter signup forms, special social media integrations, unique contact widgets, custom maps, interactive elements, special promotional sections, etc.
+5. Only return features that are clearly visible and functional in the screenshot/HTML
+6. Return 2-4 most significant custom footer features (if any exist)
+7. If no significant custom features are found, return an empty array
+
+NAMING REQUIREMENTS:
+- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
+- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
+
+Return your analysis as a JSON object with this structure:
+{
+  "custom_features": [
+    {
+      "name": "Newsletter Signup",
+      "description": "Email subscription form with promotional offers and updates."
+    },
+    {
+      "name": "Store Locator",
+      "description": "Interactive map showing nearby physical store locations."
+    }
+  ]
+}
+"""
+
+_FOOTER_ANALYSIS_SYSTEM_PROMPT = (
+    "You are an expert ecommerce UI analyst. You will be given a footer image, "
+    "footer HTML, and a template of ecommerce features to look for. "
+    "Your job is to determine which features from the template are present "
+    "in this footer by analyzing both the visual image and the HTML code, "
+    "and to identify unique custom features that go beyond the template. "
+    "Respond with valid JSON only."
+)
+
+_FOOTER_ANALYSIS_PROMPT = """
+Please analyze this website footer against the provided ecommerce template.
+
+**Website URL:** <<URL>>
+
+**Footer Template to Check:**
+<<FOOTER_TEMPLATE>>
+
+**Footer HTML Content:**
+```html
+<<HTML>>
+```
+
+**Task 1 - Template Analysis:**
+1. Review each feature in the template's "features" array
+2. Look at both the footer image and HTML to determine if each feature is present
+3. Return the EXACT same JSON structure as the template, but add a "found" field to each feature
+4. Set "found": "yes" if the feature is clearly present, "found": "no" if it's not present
+
+Be thorough but conservative - only mark "found": "yes" if you can clearly identify the feature in either the image or HTML.
+
+**Task 2 - Custom Features:**
+1. Look at the footer screenshot and HTML for additional functionality beyond the template features
+2. Identify unique/custom elements specific to this footer or site
+3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
+4. Examples might include: Custom newsletter signup forms, special social media integrations, unique contact widgets, custom maps, interactive elements, special promotional sections, etc.
+5. Only return features that are clearly visible and functional in the screenshot/HTML
+6. Return 2-4 most significant custom footer features (if any exist)
+7. If no significant custom features are found, return an empty array
+
+NAMING REQUIREMENTS:
+- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
+- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
+
+**Return Format:**
+Return a single JSON object with the template JSON (each feature having an additional "found" field) and the custom features:
+```json
+{
+    "template_analysis": {
+        "name": "Footer Template",
+        "description": "...",
+        "features": [
+            {
+                "name": "Footer Navigation Links",
+                "description": "...",
+                "found": "yes"
+            },
+            {
+                "name": "Social Media Links", 
+                "description": "...",
+                "found": "no"
+            }
+        ]
+    },
+    "custom_features": [
+        {
+            "name": "Store Locator",
+            "description": "Interactive map showing nearby physical store locations."
+        }
+    ]
+}
+```
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def _footer_analysis_prompt() -> str:
+    """Footer analysis prompt with the template JSON filled in, built once per process."""
+    return _FOOTER_ANALYSIS_PROMPT.replace("<<FOOTER_TEMPLATE>>", _footer_template_json())
+
+
+async def detect_custom_features(footer_image_path: Path, footer_html_path: Path, standard_features: List[Dict], url: str = "",
+                                 prepared_page: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
-    Second AI call to identify custom features not in the standard footer template.
+    Standalone AI call to identify custom features not in the standard footer template.
+    
+    analyze_footer_elements asks for custom features in the same request as the
+    template analysis and only falls back to this call if they are missing.
     
     Args:
         footer_image_path: Path to the footer image file
         footer_html_path: Path to the footer HTML file
         standard_features: List of already identified standard features
         url: Base URL for context
+        prepared_page: Output of _prepare_footer_page, to skip reloading the footer
         
     Returns:
         Dictionary containing custom features analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    client = get_async_openai_client()
     
-    # Encode image
+    # Encode image and read HTML
     try:
-        footer_b64 = _encode_image_to_base64(footer_image_path)
+        page = prepared_page or _prepare_footer_page(footer_image_path, footer_html_path)
     except Exception as e:
-        raise Exception(f"Failed to encode footer image: {str(e)}")
-    
-    # Read HTML content
-    try:
-        with open(footer_html_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        processed_html = html_content[:32000]  # Adaptive limit for footer custom features
-    except Exception as e:
-        raise Exception(f"Failed to read footer HTML: {str(e)}")
+        raise Exception(f"Failed to load footer: {str(e)}")
+    footer_data_url = page["image_url"]
+    processed_html = page["html_content"]
     
     # Format standard features for the prompt
     found_features = [f"- {f['name']}: {f['description']}" for f in standard_features if f.get('found') == 'yes']
@@ -122,66 +335,31 @@ async def detect_custom_features(footer_image_path: Path, footer_html_path: Path
     
     print(f"    > Sending request to GPT-5-mini for custom footer features detection...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await _create_completion(
+            client,
             model="gpt-5-mini",
+            response_format={"type": "json_object"},
             messages=[
                 {
                     "role": "system",
-                    "content": (
-                        "You are an expert web UI analyst specializing in identifying unique custom features in website footers. "
-                        "Your task is to find additional functionality that goes beyond standard footer template features. "
-                        "Focus on unique widgets, custom sections, special tools, or innovative UI elements in the footer area. "
-                        "Respond with valid JSON only."
-                    )
+                    "content": _CUSTOM_FEATURES_SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
                     "content": [
                         {
                             "type": "text",
-                            "text": f"""
-Please analyze this website footer and identify CUSTOM features that are NOT in the standard footer template.
-
-Website URL: {url}
-
-HTML Content:
-{processed_html}
-
-STANDARD FOOTER FEATURES ALREADY IDENTIFIED:
-{standard_features_text}
-
-INSTRUCTIONS:
-1. Look at the footer screenshot and HTML for additional functionality beyond the standard features listed above
-2. Identify unique/custom elements specific to this footer or site
-3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
-4. Examples might include: Custom newsletter signup forms, special social media integrations, unique contact widgets, custom maps, interactive elements, special promotional sections, etc.
-5. Only return features that are clearly visible and functional in the screenshot/HTML
-6. Return 2-4 most significant custom footer features (if any exist)
-7. If no significant custom features are found, return an empty array
-
-NAMING REQUIREMENTS:
-- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
-- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
-
-Return your analysis as a JSON object with this structure:
-{{
-  "custom_features": [
-    {{
-      "name": "Newsletter Signup",
-      "description": "Email subscription form with promotional offers and updates."
-    }},
-    {{
-      "name": "Store Locator",
-      "description": "Interactive map showing nearby physical store locations."
-    }}
-  ]
-}}
-"""
+                            "text": (_CUSTOM_FEATURES_PROMPT
+                                     .replace("<<URL>>", url)
+                                     .replace("<<STANDARD_FEATURES>>", standard_features_text)
+                                     .replace("<<HTML>>", processed_html))
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{footer_b64}"
+                                "url": footer_data_url,
+                                # Widget-level presence checks don't need high-detail image tiles
+                                "detail": "low"
                             }
                         }
                     ]
@@ -209,7 +387,7 @@ Return your analysis as a JSON object with this structure:
                 "image_path": str(footer_image_path),
                 "html_path": str(footer_html_path),
                 "url": url,
-                "raw_response": raw_text
+                **_raw_response_fields(raw_text)
             }
         else:
             print("    > ERROR: Custom footer features detection failed to extract structured data", file=sys.stderr)
@@ -237,16 +415,12 @@ async def analyze_footer_elements(footer_image_path: Path, footer_html_path: Pat
     Returns:
         Dictionary containing template-based feature analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    client = get_async_openai_client()
     
     # Load the footer template from ecommerce dictionary
     print("    > Loading footer template...", file=sys.stderr)
     try:
-        footer_template = load_footer_template()
+        footer_template_json = _footer_template_json()
     except Exception as e:
         return {
             "success": False,
@@ -256,83 +430,50 @@ async def analyze_footer_elements(footer_image_path: Path, footer_html_path: Pat
             "url": url
         }
     
-    # Load and encode the footer image
-    print("    > Loading footer image...", file=sys.stderr)
-    footer_b64 = _encode_image_to_base64(footer_image_path)
+    # Load and encode the footer image and HTML once for both prompts
+    print("    > Loading footer image and HTML...", file=sys.stderr)
+    page = _prepare_footer_page(footer_image_path, footer_html_path)
+    footer_data_url = page["image_url"]
+    html_content = page["html_content"]
     
-    # Load footer HTML content
-    print("    > Processing footer HTML content...", file=sys.stderr)
-    html_content = _load_html_content(footer_html_path)
-    # Adaptive HTML size limit for footers (32KB to cover all experienced files)
-    html_content = html_content[:32000]
+    # The same screenshot, HTML and template always get the same analysis, so reuse a cached result
+    cache_key = make_cache_key("gpt-5-mini", _FOOTER_PROMPT_VERSION, file_digest(_DICTIONARY_PATH),
+                               footer_template_json, url, footer_data_url, html_content)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        print("    > Using cached footer analysis", file=sys.stderr)
+        return {
+            "success": True,
+            "template_analysis": cached["template_analysis"],
+            "image_path": str(footer_image_path),
+            "html_path": str(footer_html_path),
+            "url": url,
+            **_raw_response_fields(cached["raw_response"]),
+            "custom_features": cached["custom_features"]
+        }
     
     print("    > Sending request to GPT-4...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await _create_completion(
+            client,
             model="gpt-5-mini",
+            response_format={"type": "json_object"},
             messages=[
                 {
                     "role": "system",
-                    "content": (
-                        "You are an expert ecommerce UI analyst. You will be given a footer image, "
-                        "footer HTML, and a template of ecommerce features to look for. "
-                        "Your job is to determine which features from the template are present "
-                        "in this footer by analyzing both the visual image and the HTML code. "
-                        "Respond with valid JSON only."
-                    )
+                    "content": _FOOTER_ANALYSIS_SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
                     "content": [
                         {
                             "type": "text",
-                            "text": f"""
-Please analyze this website footer against the provided ecommerce template.
-
-**Website URL:** {url}
-
-**Footer Template to Check:**
-{json.dumps(footer_template, indent=2)}
-
-**Footer HTML Content:**
-```html
-{html_content}
-```
-
-**Instructions:**
-1. Review each feature in the template's "features" array
-2. Look at both the footer image and HTML to determine if each feature is present
-3. Return the EXACT same JSON structure as the template, but add a "found" field to each feature
-4. Set "found": "yes" if the feature is clearly present, "found": "no" if it's not present
-
-**Return Format:**
-Return the template JSON with each feature having an additional "found" field:
-```json
-{{
-    "name": "Footer Template",
-    "description": "...",
-    "features": [
-        {{
-            "name": "Footer Navigation Links",
-            "description": "...",
-            "found": "yes"
-        }},
-        {{
-            "name": "Social Media Links", 
-            "description": "...",
-            "found": "no"
-        }}
-    ]
-}}
-```
-
-Be thorough but conservative - only mark "found": "yes" if you can clearly identify the feature in either the image or HTML.
-"""
+                            "text": _footer_analysis_prompt().replace("<<URL>>", url).replace("<<HTML>>", html_content)
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{footer_b64}",
+                                "url": footer_data_url,
                                 "detail": "high"
                             }
                         }
@@ -342,33 +483,52 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
         )
         
         print("    > Processing GPT-4 response...", file=sys.stderr)
-        analysis_data, raw_response = _extract_json_from_response(response)
+        response_data, raw_response = _extract_json_from_response(response)
+        
+        # Accept a bare template object in case the model skipped the wrapper
+        analysis_data = None
+        if response_data:
+            analysis_data = response_data.get("template_analysis") or (response_data if "features" in response_data else None)
         
         if analysis_data:
             print("    > Footer template analysis completed successfully", file=sys.stderr)
             
-            # Step 2: Detect custom features not in the standard template
-            print("    > Detecting custom footer features...", file=sys.stderr)
-            standard_features = analysis_data.get("features", [])
-            custom_features_analysis = await detect_custom_features(footer_image_path, footer_html_path, standard_features, url)
-            
-            # Combine results (include custom features even if detection failed)
             result = {
                 "success": True,
                 "template_analysis": analysis_data,
                 "image_path": str(footer_image_path),
                 "html_path": str(footer_html_path),
                 "url": url,
-                "raw_response": raw_response
+                **_raw_response_fields(raw_response)
             }
             
-            # Add custom features if detection was successful
-            if custom_features_analysis.get("success", False):
-                result["custom_features"] = custom_features_analysis.get("custom_features", [])
+            custom_features_found = isinstance(response_data.get("custom_features"), list)
+            if custom_features_found:
+                result["custom_features"] = response_data["custom_features"]
                 print(f"    > Custom footer features integrated: {len(result['custom_features'])} features", file=sys.stderr)
             else:
-                result["custom_features"] = []
-                print(f"    > Custom footer features detection failed: {custom_features_analysis.get('error', 'Unknown error')}", file=sys.stderr)
+                # Fall back to a separate call if the combined response omitted custom features
+                print("    > Detecting custom footer features...", file=sys.stderr)
+                standard_features = analysis_data.get("features", [])
+                custom_features_analysis = await detect_custom_features(footer_image_path, footer_html_path, standard_features, url,
+                                                                        prepared_page=page)
+                
+                # Include custom features even if detection failed
+                custom_features_found = custom_features_analysis.get("success", False)
+                if custom_features_found:
+                    result["custom_features"] = custom_features_analysis.get("custom_features", [])
+                    print(f"    > Custom footer features integrated: {len(result['custom_features'])} features", file=sys.stderr)
+                else:
+                    result["custom_features"] = []
+                    print(f"    > Custom footer features detection failed: {custom_features_analysis.get('error', 'Unknown error')}", file=sys.stderr)
+            
+            # Only complete analyses are cached, so a failed custom features call is retried next time
+            if custom_features_found:
+                response_cache.set(cache_key, {
+                    "template_analysis": analysis_data,
+                    "custom_features": result["custom_features"],
+                    "raw_response": raw_response
+                })
             
             return result
         else:
@@ -379,7 +539,7 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
                 "image_path": str(footer_image_path),
                 "html_path": str(footer_html_path),
                 "url": url,
-                "raw_response": raw_response
+                **_raw_response_fields(raw_response)
             }
             
     except Exception as e:
@@ -393,6 +553,62 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
         }
 
 
+async def analyze_many(footers: List[Tuple[Path, Path, str]], concurrency: int = 16) -> List[Any]:
+    """
+    Analyze many footers concurrently with analyze_footer_elements.
+    
+    At most `concurrency` footers are in flight at once, which keeps bulk runs
+    under the OpenAI requests-per-minute limit while N footers take roughly
+    ceil(N / concurrency) round trips instead of N.
+    
+    Args:
+        footers: List of (footer_image_path, footer_html_path, url) tuples
+        concurrency: Maximum number of footers analyzed at the same time
+        
+    Returns:
+        List of analysis results in input order; an exception object takes the
+        place of any footer whose analysis raised
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def analyze_one(footer_image_path: Path, footer_html_path: Path, url: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await analyze_footer_elements(footer_image_path, footer_html_path, url)
+    
+    return await asyncio.gather(*[analyze_one(*footer) for footer in footers], return_exceptions=True)
+
+
+async def analyze_footer_elements_batched(footers: List[Tuple[Path, Path, str]], poll_interval: int = 60) -> List[Dict[str, Any]]:
+    """
+    Analyze many footers through the OpenAI Batch API instead of real-time calls.
+    
+    All footers are submitted as one batch (plus a second one for any custom
+    features fallback calls). Batch jobs cost about half as much but may take
+    up to 24 hours, so this is intended for bulk, non-interactive runs; use
+    analyze_footer_elements or analyze_many otherwise.
+    
+    Args:
+        footers: List of (footer_image_path, footer_html_path, url) tuples
+        poll_interval: Seconds to wait between batch status checks
+        
+    Returns:
+        List of analysis results in the same order and shape as analyze_footer_elements
+    """
+    dispatcher = BatchDispatcher(get_async_openai_client(), len(footers), poll_interval)
+    
+    async def run_footer(footer_image_path: Path, footer_html_path: Path, url: str) -> Dict[str, Any]:
+        try:
+            return await analyze_footer_elements(footer_image_path, footer_html_path, url)
+        finally:
+            dispatcher.pipeline_finished()
+    
+    token = _batch_dispatcher.set(dispatcher)
+    try:
+        return await asyncio.gather(*[run_footer(*footer) for footer in footers])
+    finally:
+        _batch_dispatcher.reset(token)
+
+
 def print_analysis_results(analysis: Dict[str, Any]) -> None:
     """
     Print analysis results in a formatted way for command line output.
@@ -403,27 +619,30 @@ def print_analysis_results(analysis: Dict[str, Any]) -> None:
     
     template_data = analysis.get("template_analysis", {})
     features = template_data.get("features", [])
-    
-    print(f"\n🎯 Footer Template Analysis Results")
-    print(f"📄 Template: {template_data.get('name', 'Unknown')}")
-    print(f"🌐 URL: {analysis.get('url', 'Unknown')}")
-    print(f"📊 Features Found: {sum(1 for f in features if f.get('found') == 'yes')}/{len(features)}")
-    
-    print(f"\n✅ **Features Present:**")
+    present, missing = [], []
     for feature in features:
-        if feature.get("found") == "yes":
-            print(f"  • {feature.get('name', 'Unknown')}")
+        found = feature.get("found")
+        if found == "yes":
+            present.append(f"  • {feature.get('name', 'Unknown')}")
+        elif found == "no":
+            missing.append(f"  • {feature.get('name', 'Unknown')}")
     
-    print(f"\n❌ **Features Not Found:**")
-    for feature in features:
-        if feature.get("found") == "no":
-            print(f"  • {feature.get('name', 'Unknown')}")
+    # Build the report first and print it in one call
+    lines = [
+        "\n🎯 Footer Template Analysis Results",
+        f"📄 Template: {template_data.get('name', 'Unknown')}",
+        f"🌐 URL: {analysis.get('url', 'Unknown')}",
+        f"📊 Features Found: {len(present)}/{len(features)}",
+        "\n✅ **Features Present:**",
+        *present,
+        "\n❌ **Features Not Found:**",
+        *missing
+    ]
+    print("\n".join(lines))
 
 
 # For command line testing
 if __name__ == "__main__":
-    import asyncio
-    
     if len(sys.argv) != 4:
         print("Usage: python footer_analyzer_new.py <footer_image_path> <footer_html_path> <url>")
         sys.exit(1)
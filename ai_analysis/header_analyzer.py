@@ -5,18 +5,43 @@ Uses GPT-5 to analyze header images and HTML against the ecommerce dictionary
 template to identify which features are present or absent.
 """
 
-import os
 import sys
-import base64
 import json
 import re
+import asyncio
+import functools
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
-from dotenv import load_dotenv
-from openai import OpenAI
+try:
+    from .utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision,
+                        PNG_DATA_URL_PREFIX, iter_json_objects, minify_html_for_llm, json_schema_format,
+                        TEMPLATE_FEATURES_SCHEMA, CUSTOM_FEATURES_SCHEMA)
+    from .response_cache import response_cache, make_cache_key, file_digest
+except ImportError:
+    # Run directly as a script, outside the ai_analysis package
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ai_analysis.utils import (get_async_openai_client, encode_image_to_base64, encode_image_for_vision,
+                                   PNG_DATA_URL_PREFIX, iter_json_objects, minify_html_for_llm, json_schema_format,
+                                   TEMPLATE_FEATURES_SCHEMA, CUSTOM_FEATURES_SCHEMA)
+    from ai_analysis.response_cache import response_cache, make_cache_key, file_digest
 
-# Load environment variables
-load_dotenv()
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+# Code block fallback used by _extract_json_from_response, compiled once at import (replies use
+# strict structured outputs, so this only matters if a reply somehow isn't a bare JSON document)
+_JSON_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Part of the response cache key; bump when the header prompts change so stale analyses are not reused
+_HEADER_PROMPT_VERSION = "header-v5"
+
+# Template dictionary; its content digest is also part of the response cache key
+_DICTIONARY_PATH = Path(__file__).parent / "ecommerce_dictionary.json"
+
+# Retries for transient errors (429, 408/409, 5xx, connection failures)
+_MAX_RETRIES = 4
 
 
 def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
@@ -32,46 +57,75 @@ def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
     # Try to extract JSON from the response
     try:
         # First, try to parse the entire response as JSON
-        data = json.loads(raw_text)
+        data = _json_loads(raw_text)
     except json.JSONDecodeError:
         # If that fails, try to find JSON within code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
+        json_match = _JSON_CODE_BLOCK_RE.search(raw_text)
         if json_match:
             try:
-                data = json.loads(json_match.group(1))
+                data = _json_loads(json_match.group(1))
             except json.JSONDecodeError:
                 pass
         
-        # If still no luck, try to find any JSON-like structure
+        # If still no luck, try each balanced {...} object found by a linear brace scan
         if data is None:
-            json_match = re.search(r'(\{.*\})', raw_text, re.DOTALL)
-            if json_match:
+            for candidate_json in iter_json_objects(raw_text):
                 try:
-                    data = json.loads(json_match.group(1))
+                    data = _json_loads(candidate_json)
+                    break
                 except json.JSONDecodeError:
-                    pass
+                    continue
     
     return data, raw_text
 
 
-def _encode_image_to_base64(image_path: Path) -> str:
-    """Encode an image file to base64 string."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def _encode_image_to_data_url(image_path: Path) -> str:
+    """Encode a header screenshot as a data URL, cached by path, modification time and size."""
+    stat = image_path.stat()
+    return _cached_image_data_url(str(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_image_data_url(image_path: str, mtime_ns: int, size: int) -> str:
+    """Encode the image at image_path as a data URL; mtime_ns and size only key the cache."""
+    path = Path(image_path)
+    try:
+        # Downscaled to what the vision model uses and re-encoded as WebP when that is smaller
+        data_url = encode_image_for_vision(path)
+        if data_url:
+            return data_url
+    except (OSError, ValueError) as e:
+        print(f"    > Warning: Could not re-encode {path.name} for vision ({e}), sending original image", file=sys.stderr)
+    return encode_image_to_base64(path, prefix=PNG_DATA_URL_PREFIX)
+
+
+# Upper bound on raw header HTML read from disk; well above what survives minification and the
+# token budget below, it only keeps a mis-scoped full-page dump from being read and minified whole
+HEADER_HTML_MAX_BYTES = 1_000_000
+
+
+def _load_html_content(html_path: Path, max_bytes: int = HEADER_HTML_MAX_BYTES) -> str:
+    """Load up to max_bytes of HTML content from file."""
+    with open(html_path, "rb") as f:
+        # A cut can split a multi-byte character, so replace rather than fail on it
+        return f.read(max_bytes).decode("utf-8", errors="replace")
 
 
-def _load_html_content(html_path: Path) -> str:
-    """Load HTML content from file."""
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+# Token budget for the header HTML sent to the model, using a rough 4 characters per token for markup
+HEADER_HTML_MAX_TOKENS = 8000
+_CHARS_PER_TOKEN = 4
 
 
+def _prepare_header_html(html_content: str) -> str:
+    """Minify header HTML and truncate it to roughly HEADER_HTML_MAX_TOKENS tokens."""
+    return minify_html_for_llm(html_content)[:HEADER_HTML_MAX_TOKENS * _CHARS_PER_TOKEN]
+
+
+@functools.lru_cache(maxsize=1)
 def load_header_template() -> dict:
-    """Load the Header Template section from ecommerce_dictionary.json"""
+    """Load the Header Template section from ecommerce_dictionary.json (cached; treat as read-only)"""
     try:
-        dict_path = Path(__file__).parent / "ecommerce_dictionary.json"
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _json_loads(_DICTIONARY_PATH.read_bytes())
         
         # Find the Header Template
         for template in data.get("templates", []):
@@ -83,7 +137,104 @@ def load_header_template() -> dict:
         raise Exception(f"Failed to load header template: {str(e)}")
 
 
-async def detect_custom_features(header_image_path: Path, header_html_path: Path, standard_features: List[Dict], url: str = "") -> Dict[str, Any]:
+# Prompts are split static-first: the instructions (identical on every call, so OpenAI's
+# prompt cache can reuse their prefix) come before the per-page URL, HTML and screenshot.
+# Dynamic values fill <<SLOT>> placeholders, with the page HTML always substituted last.
+_CUSTOM_FEATURES_INSTRUCTIONS = """
+Please analyze the website header provided below and identify CUSTOM features that are NOT in the standard header template.
+
+INSTRUCTIONS:
+1. Look at the header screenshot and HTML for additional functionality beyond the standard features listed with the page
+2. Identify unique/custom elements specific to this header or site
+3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
+4. Examples might include: Custom mega menus, special promotional banners, unique search features, custom user tools, interactive elements, special navigation patterns, etc.
+5. Only return features that are clearly visible and functional in the screenshot/HTML
+6. Return 2-4 most significant custom header features (if any exist)
+7. If no significant custom features are found, return an empty array
+
+NAMING REQUIREMENTS:
+- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
+- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
+
+Return your analysis as a JSON object with this structure:
+{
+  "custom_features": [
+    {
+      "name": "Mega Menu",
+      "description": "Large dropdown menu with product categories and featured items."
+    },
+    {
+      "name": "Promo Banner",
+      "description": "Rotating promotional banner with current sales and offers."
+    }
+  ]
+}
+"""
+
+_CUSTOM_FEATURES_PAGE = """
+Website URL: <<URL>>
+
+STANDARD HEADER FEATURES ALREADY IDENTIFIED:
+<<STANDARD_FEATURES>>
+
+HTML Content:
+<<HTML>>
+"""
+
+_HEADER_ANALYSIS_INSTRUCTIONS = """
+Please analyze the website header provided below against this ecommerce template.
+
+**Header Template to Check:**
+<<HEADER_TEMPLATE>>
+
+**Instructions:**
+1. Review each feature in the template's "features" array
+2. Look at both the header image and HTML to determine if each feature is present
+3. Return the EXACT same JSON structure as the template, but add a "found" field to each feature
+4. Set "found": "yes" if the feature is clearly present, "found": "no" if it's not present
+
+**Return Format:**
+Return the template JSON with each feature having an additional "found" field:
+```json
+{
+    "name": "Header Template",
+    "description": "...",
+    "features": [
+        {
+            "name": "Logo",
+            "description": "...",
+            "found": "yes"
+        },
+        {
+            "name": "Search Box", 
+            "description": "...",
+            "found": "no"
+        }
+    ]
+}
+```
+
+Be thorough but conservative - only mark "found": "yes" if you can clearly identify the feature in either the image or HTML.
+"""
+
+_HEADER_ANALYSIS_PAGE = """
+**Website URL:** <<URL>>
+
+**Header HTML Content:**
+```html
+<<HTML>>
+```
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def _header_analysis_instructions() -> str:
+    """Header analysis instructions with the template JSON filled in, built once per process."""
+    return _HEADER_ANALYSIS_INSTRUCTIONS.replace("<<HEADER_TEMPLATE>>", json.dumps(load_header_template(), indent=2))
+
+
+async def detect_custom_features(header_image_path: Path, header_html_path: Path, standard_features: List[Dict], url: str = "",
+                                 processed_html: Optional[str] = None) -> Dict[str, Any]:
     """
     Second AI call to identify custom features not in the standard header template.
     
@@ -92,29 +243,27 @@ async def detect_custom_features(header_image_path: Path, header_html_path: Path
         header_html_path: Path to the header HTML file
         standard_features: List of already identified standard features
         url: Base URL for context
+        processed_html: Header HTML already passed through _prepare_header_html, to skip
+            re-reading and re-minifying the file
         
     Returns:
         Dictionary containing custom features analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    # Shared pooled client; transient errors are retried by the SDK with exponential backoff
+    client = get_async_openai_client().with_options(max_retries=_MAX_RETRIES)
     
     # Encode image
     try:
-        header_b64 = _encode_image_to_base64(header_image_path)
+        header_data_url = _encode_image_to_data_url(header_image_path)
     except Exception as e:
         raise Exception(f"Failed to encode header image: {str(e)}")
     
-    # Read HTML content
-    try:
-        with open(header_html_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        processed_html = html_content[:32000]  # Adaptive limit for header custom features
-    except Exception as e:
-        raise Exception(f"Failed to read header HTML: {str(e)}")
+    # Read HTML content unless the caller already prepared it
+    if processed_html is None:
+        try:
+            processed_html = _prepare_header_html(_load_html_content(header_html_path))
+        except Exception as e:
+            raise Exception(f"Failed to read header HTML: {str(e)}")
     
     # Format standard features for the prompt
     found_features = [f"- {f['name']}: {f['description']}" for f in standard_features if f.get('found') == 'yes']
@@ -122,8 +271,9 @@ async def detect_custom_features(header_image_path: Path, header_html_path: Path
     
     print(f"    > Sending request to GPT-5-mini for custom header features detection...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-5-mini",
+            response_format=json_schema_format("custom_features", CUSTOM_FEATURES_SCHEMA),
             messages=[
                 {
                     "role": "system",
@@ -139,49 +289,19 @@ async def detect_custom_features(header_image_path: Path, header_html_path: Path
                     "content": [
                         {
                             "type": "text",
-                            "text": f"""
-Please analyze this website header and identify CUSTOM features that are NOT in the standard header template.
-
-Website URL: {url}
-
-HTML Content:
-{processed_html}
-
-STANDARD HEADER FEATURES ALREADY IDENTIFIED:
-{standard_features_text}
-
-INSTRUCTIONS:
-1. Look at the header screenshot and HTML for additional functionality beyond the standard features listed above
-2. Identify unique/custom elements specific to this header or site
-3. Focus on features that provide special functionality, custom widgets, unique sections, or innovative UI elements
-4. Examples might include: Custom mega menus, special promotional banners, unique search features, custom user tools, interactive elements, special navigation patterns, etc.
-5. Only return features that are clearly visible and functional in the screenshot/HTML
-6. Return 2-4 most significant custom header features (if any exist)
-7. If no significant custom features are found, return an empty array
-
-NAMING REQUIREMENTS:
-- **Name**: Keep it SHORT (2-4 words max) - concise feature identifier
-- **Description**: Keep it BRIEF (1-2 sentences max) - what it does, not why it's unique
-
-Return your analysis as a JSON object with this structure:
-{{
-  "custom_features": [
-    {{
-      "name": "Mega Menu",
-      "description": "Large dropdown menu with product categories and featured items."
-    }},
-    {{
-      "name": "Promo Banner",
-      "description": "Rotating promotional banner with current sales and offers."
-    }}
-  ]
-}}
-"""
+                            "text": _CUSTOM_FEATURES_INSTRUCTIONS
+                        },
+                        {
+                            "type": "text",
+                            "text": (_CUSTOM_FEATURES_PAGE
+                                     .replace("<<URL>>", url)
+                                     .replace("<<STANDARD_FEATURES>>", standard_features_text)
+                                     .replace("<<HTML>>", processed_html))
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{header_b64}"
+                                "url": header_data_url
                             }
                         }
                     ]
@@ -237,16 +357,13 @@ async def analyze_header_elements(header_image_path: Path, header_html_path: Pat
     Returns:
         Dictionary containing template-based feature analysis results
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    # Shared pooled client; transient errors are retried by the SDK with exponential backoff
+    client = get_async_openai_client().with_options(max_retries=_MAX_RETRIES)
     
     # Load the header template from ecommerce dictionary
     print("    > Loading header template...", file=sys.stderr)
     try:
-        header_template = load_header_template()
+        header_instructions = _header_analysis_instructions()
     except Exception as e:
         return {
             "success": False,
@@ -258,18 +375,33 @@ async def analyze_header_elements(header_image_path: Path, header_html_path: Pat
     
     # Load and encode the header image
     print("    > Loading header image...", file=sys.stderr)
-    header_b64 = _encode_image_to_base64(header_image_path)
+    header_data_url = _encode_image_to_data_url(header_image_path)
     
     # Load header HTML content
     print("    > Processing header HTML content...", file=sys.stderr)
-    html_content = _load_html_content(header_html_path)
-    # Adaptive HTML size limit for headers (32KB to cover all experienced files)
-    html_content = html_content[:32000]
+    html_content = _prepare_header_html(_load_html_content(header_html_path))
+    
+    # The same screenshot, HTML and template always get the same analysis, so reuse a cached result
+    cache_key = make_cache_key("gpt-5-mini", _HEADER_PROMPT_VERSION, file_digest(_DICTIONARY_PATH),
+                               header_instructions, url, header_data_url, html_content)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        print("    > Using cached header analysis", file=sys.stderr)
+        return {
+            "success": True,
+            "template_analysis": cached["template_analysis"],
+            "image_path": str(header_image_path),
+            "html_path": str(header_html_path),
+            "url": url,
+            "raw_response": cached["raw_response"],
+            "custom_features": cached["custom_features"]
+        }
     
     print("    > Sending request to GPT-5...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-5-mini",
+            response_format=json_schema_format("template_features", TEMPLATE_FEATURES_SCHEMA),
             messages=[
                 {
                     "role": "system",
@@ -286,53 +418,16 @@ async def analyze_header_elements(header_image_path: Path, header_html_path: Pat
                     "content": [
                         {
                             "type": "text",
-                            "text": f"""
-Please analyze this website header against the provided ecommerce template.
-
-**Website URL:** {url}
-
-**Header Template to Check:**
-{json.dumps(header_template, indent=2)}
-
-**Header HTML Content:**
-```html
-{html_content}
-```
-
-**Instructions:**
-1. Review each feature in the template's "features" array
-2. Look at both the header image and HTML to determine if each feature is present
-3. Return the EXACT same JSON structure as the template, but add a "found" field to each feature
-4. Set "found": "yes" if the feature is clearly present, "found": "no" if it's not present
-
-**Return Format:**
-Return the template JSON with each feature having an additional "found" field:
-```json
-{{
-    "name": "Header Template",
-    "description": "...",
-    "features": [
-        {{
-            "name": "Logo",
-            "description": "...",
-            "found": "yes"
-        }},
-        {{
-            "name": "Search Box", 
-            "description": "...",
-            "found": "no"
-        }}
-    ]
-}}
-```
-
-Be thorough but conservative - only mark "found": "yes" if you can clearly identify the feature in either the image or HTML.
-"""
+                            "text": header_instructions
+                        },
+                        {
+                            "type": "text",
+                            "text": _HEADER_ANALYSIS_PAGE.replace("<<URL>>", url).replace("<<HTML>>", html_content)
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{header_b64}",
+                                "url": header_data_url,
                                 "detail": "high"
                             }
                         }
@@ -350,7 +445,8 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
             # Step 2: Detect custom features not in the standard template
             print("    > Detecting custom header features...", file=sys.stderr)
             standard_features = analysis_data.get("features", [])
-            custom_features_analysis = await detect_custom_features(header_image_path, header_html_path, standard_features, url)
+            custom_features_analysis = await detect_custom_features(header_image_path, header_html_path, standard_features, url,
+                                                                    processed_html=html_content)
             
             # Combine results (include custom features even if detection failed)
             result = {
@@ -366,6 +462,12 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
             if custom_features_analysis.get("success", False):
                 result["custom_features"] = custom_features_analysis.get("custom_features", [])
                 print(f"    > Custom header features integrated: {len(result['custom_features'])} features", file=sys.stderr)
+                # Only complete analyses are cached, so a failed custom features call is retried next time
+                response_cache.set(cache_key, {
+                    "template_analysis": analysis_data,
+                    "custom_features": result["custom_features"],
+                    "raw_response": raw_response
+                })
             else:
                 result["custom_features"] = []
                 print(f"    > Custom header features detection failed: {custom_features_analysis.get('error', 'Unknown error')}", file=sys.stderr)
@@ -393,6 +495,31 @@ Be thorough but conservative - only mark "found": "yes" if you can clearly ident
         }
 
 
+async def analyze_many(headers: List[Tuple[Path, Path, str]], concurrency: int = 16) -> List[Any]:
+    """
+    Analyze many headers concurrently with analyze_header_elements.
+    
+    At most `concurrency` headers are in flight at once, which keeps bulk runs
+    under the OpenAI requests-per-minute limit while N headers take roughly
+    ceil(N / concurrency) round trips instead of N.
+    
+    Args:
+        headers: List of (header_image_path, header_html_path, url) tuples
+        concurrency: Maximum number of headers analyzed at the same time
+        
+    Returns:
+        List of analysis results in input order; an exception object takes the
+        place of any header whose analysis raised
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def analyze_one(header_image_path: Path, header_html_path: Path, url: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await analyze_header_elements(header_image_path, header_html_path, url)
+    
+    return await asyncio.gather(*[analyze_one(*header) for header in headers], return_exceptions=True)
+
+
 def print_analysis_results(analysis: Dict[str, Any]) -> None:
     """
     Print analysis results in a formatted way for command line output.
@@ -403,27 +530,30 @@ def print_analysis_results(analysis: Dict[str, Any]) -> None:
     
     template_data = analysis.get("template_analysis", {})
     features = template_data.get("features", [])
-    
-    print(f"\n🎯 Header Template Analysis Results")
-    print(f"📄 Template: {template_data.get('name', 'Unknown')}")
-    print(f"🌐 URL: {analysis.get('url', 'Unknown')}")
-    print(f"📊 Features Found: {sum(1 for f in features if f.get('found') == 'yes')}/{len(features)}")
-    
-    print(f"\n✅ **Features Present:**")
+    present, missing = [], []
     for feature in features:
-        if feature.get("found") == "yes":
-            print(f"  • {feature.get('name', 'Unknown')}")
+        found = feature.get("found")
+        if found == "yes":
+            present.append(f"  • {feature.get('name', 'Unknown')}")
+        elif found == "no":
+            missing.append(f"  • {feature.get('name', 'Unknown')}")
     
-    print(f"\n❌ **Features Not Found:**")
-    for feature in features:
-        if feature.get("found") == "no":
-            print(f"  • {feature.get('name', 'Unknown')}")
+    # Build the report first and print it in one call
+    lines = [
+        "\n🎯 Header Template Analysis Results",
+        f"📄 Template: {template_data.get('name', 'Unknown')}",
+        f"🌐 URL: {analysis.get('url', 'Unknown')}",
+        f"📊 Features Found: {len(present)}/{len(features)}",
+        "\n✅ **Features Present:**",
+        *present,
+        "\n❌ **Features Not Found:**",
+        *missing
+    ]
+    print("\n".join(lines))
 
 
 # For command line testing
 if __name__ == "__main__":
-    import asyncio
-    
     if len(sys.argv) != 4:
         print("Usage: python header_analyzer_new.py <header_image_path> <header_html_path> <url>")
         sys.exit(1)
@@ -0,0 +1,49 @@
+"""
+Rate Limiter Module
+
+Async token bucket used to keep GPT request rates under the account's
+requests-per-minute limit, so bursts of concurrent analyses wait briefly
+instead of hitting 429 errors and retrying.
+
+Usage:
+    limiter = RateLimiter(requests_per_minute=500)
+    await limiter.acquire()
+"""
+
+import time
+import asyncio
+from typing import Optional
+
+
+class RateLimiter:
+    """Token bucket that allows up to requests_per_minute acquisitions per minute."""
+
+    def __init__(self, requests_per_minute: int):
+        """
+        Initialize the limiter with a full bucket.
+
+        Args:
+            requests_per_minute: Sustained request rate, also the maximum burst size
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.capacity = requests_per_minute
+        self.refill_rate = requests_per_minute / 60.0
+        self._tokens = float(requests_per_minute)
+        self._updated_at = time.monotonic()
+        # Created on first acquire so it binds to the running loop (Python 3.8/3.9)
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        """Wait until a request may be sent, then consume one token."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.refill_rate)
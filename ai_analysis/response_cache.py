@@ -0,0 +1,178 @@
+"""
+Response Cache Module
+
+Caches parsed GPT responses keyed by a hash of the request inputs so that
+re-analyzing an unchanged page skips the paid API round trip.
+
+Entries live in a bounded in-memory LRU backed by a small SQLite file and
+expire after a TTL (24 hours by default). Callers get their own copy of a
+cached value, so mutating a result never changes what is cached.
+
+Analyzers key entries on the model name, their prompt version, the
+ecommerce_dictionary.json content digest (see file_digest) and the page
+inputs, so changing prompts, templates or the model misses the cache
+instead of returning a stale analysis. Set DEFINE_OS_CACHE=0 to bypass the cache.
+
+The SQLite file is opened on first use rather than at import, and the
+connection is shared between threads behind a lock, since analyzers also
+run from worker threads (asyncio.to_thread).
+"""
+
+import os
+import re
+import copy
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / ".cache" / "responses.sqlite3"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MEMORY_ENTRIES = 256
+
+_HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt_text(text: str) -> str:
+    """Strip HTML comments and collapse whitespace so cosmetic HTML changes still hit the cache."""
+    return _WHITESPACE_RE.sub(' ', _HTML_COMMENT_RE.sub('', text)).strip()
+
+
+def make_cache_key(*parts: str) -> str:
+    """Build a SHA-256 cache key from the given request parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content, recomputed only when its modification time or size changes."""
+    stat = path.stat()
+    return _cached_file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_file_digest(path: str, mtime_ns: int, size: int) -> str:
+    """Hash the file at path; mtime_ns and size only key the cache."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class ResponseCache:
+    """In-memory response cache with an optional SQLite backing file."""
+
+    def __init__(self, db_path: Optional[Path] = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 enabled: bool = True, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path: SQLite file for persistent entries, or None for memory only
+            ttl_seconds: Age after which entries are treated as missing
+            enabled: When False, every lookup misses and nothing is stored
+            max_memory_entries: Most recently used entries kept in memory; older ones are
+                only served from the SQLite file
+        """
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._db_path = db_path if enabled else None
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_opened = False
+        self._db_lock = threading.Lock()
+
+    def _remember(self, key: str, stored_at: float, value: Dict[str, Any]) -> None:
+        """Put an entry in the memory LRU, evicting the least recently used beyond the limit."""
+        with self._memory_lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite backend on first use; call with _db_lock held. Returns None when unavailable."""
+        if self._db_opened:
+            return self._db
+        self._db_opened = True
+        if self._db_path is None:
+            return None
+
+        try:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Shared across threads; every use is serialized by _db_lock
+            self._db = sqlite3.connect(str(self._db_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, ts INTEGER)"
+            )
+            self._db.commit()
+        except (OSError, sqlite3.Error) as e:
+            print(f"    > Warning: Response cache disk backend unavailable ({self._db_path}): {e}", file=sys.stderr)
+            self._db = None
+        return self._db
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None on a miss or expired entry."""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                else:
+                    del self._memory[key]
+                    entry = None
+        if entry is not None:
+            return copy.deepcopy(entry[1])
+
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT value, ts FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None or now - row[1] >= self.ttl_seconds:
+            return None
+
+        value = json.loads(row[0])
+        self._remember(key, row[1], value)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a JSON-serializable value under key."""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        self._remember(key, now, copy.deepcopy(value))
+
+        with self._db_lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, ts) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), int(now))
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"    > Warning: Failed to persist cached response: {e}", file=sys.stderr)
+
+
+# Shared cache instance used by the analyzers
+response_cache = ResponseCache(enabled=os.getenv("DEFINE_OS_CACHE", "1") != "0")
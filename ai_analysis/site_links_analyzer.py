@@ -6,18 +6,38 @@ Uses GPT-4 to analyze header and footer images and HTML to extract all links
 Now includes template categorization functionality.
 """
 
-import os
 import sys
-import base64
 import json
 import re
+import asyncio
+import functools
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
-from dotenv import load_dotenv
-from openai import OpenAI
+from urllib.parse import urlparse
 
-# Load environment variables
-load_dotenv()
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from .utils import (get_async_openai_client, encode_image_to_base64, iter_json_objects,
+                        PNG_DATA_URL_PREFIX)
+except ImportError:
+    # Run directly as a script by ui/server.js, outside the ai_analysis package
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ai_analysis.utils import (get_async_openai_client, encode_image_to_base64, iter_json_objects,
+                                   PNG_DATA_URL_PREFIX)
+
+# Retries for transient errors (429, 408/409, 5xx, connection failures), as the SDK default did
+# when each call built its own client
+_MAX_RETRIES = 2
+
+# Code block fallback for replies that aren't a bare JSON document, compiled once at import
+_JSON_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Closing tags _chunk_html_content prefers to split HTML after
+_CHUNK_BREAK_RE = re.compile(r'</(?:div|section|nav|ul|ol|li|a)>')
 
 
 def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
@@ -33,32 +53,31 @@ def _extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
     # Try to extract JSON from the response
     try:
         # First, try to parse the entire response as JSON
-        data = json.loads(raw_text)
+        data = _json_loads(raw_text)
     except json.JSONDecodeError:
         # If that fails, try to find JSON within code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
+        json_match = _JSON_CODE_BLOCK_RE.search(raw_text)
         if json_match:
             try:
-                data = json.loads(json_match.group(1))
+                data = _json_loads(json_match.group(1))
             except json.JSONDecodeError:
                 pass
         
-        # If still no luck, try to find any JSON-like structure
+        # If still no luck, try each balanced {...} object found by a linear brace scan
         if data is None:
-            json_match = re.search(r'(\{.*\})', raw_text, re.DOTALL)
-            if json_match:
+            for candidate_json in iter_json_objects(raw_text):
                 try:
-                    data = json.loads(json_match.group(1))
+                    data = _json_loads(candidate_json)
+                    break
                 except json.JSONDecodeError:
-                    pass
+                    continue
     
     return data, raw_text
 
 
-def _encode_image_to_base64(image_path: Path) -> str:
-    """Encode an image file to base64 string."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def _encode_image_to_data_url(image_path: Path) -> str:
+    """Encode a PNG screenshot as a data URL."""
+    return encode_image_to_base64(image_path, prefix=PNG_DATA_URL_PREFIX)
 
 
 def _chunk_html_content(html_content: str, chunk_size: int = 48000) -> List[str]:
@@ -87,16 +106,12 @@ def _chunk_html_content(html_content: str, chunk_size: int = 48000) -> List[str]
             # Look for tag boundaries within the last 1000 characters
             search_start = max(end_pos - 1000, current_pos)
             
-            # Try to find closing tags as good break points
-            break_points = []
-            for tag in ['</div>', '</section>', '</nav>', '</ul>', '</ol>', '</li>', '</a>']:
-                pos = html_content.rfind(tag, search_start, end_pos)
-                if pos > search_start:
-                    break_points.append(pos + len(tag))
-            
-            # Use the latest break point if found
-            if break_points:
-                end_pos = max(break_points)
+            # Break after the last closing tag in that window, found in one regex pass
+            last_match = None
+            for last_match in _CHUNK_BREAK_RE.finditer(html_content, search_start, end_pos):
+                pass
+            if last_match and last_match.start() > search_start:
+                end_pos = last_match.end()
         
         # Extract chunk
         chunk = html_content[current_pos:end_pos]
@@ -110,16 +125,14 @@ def _chunk_html_content(html_content: str, chunk_size: int = 48000) -> List[str]
 
 def _load_html_content(html_path: Path) -> str:
     """Load HTML content from file."""
-    with open(html_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return html_path.read_text(encoding="utf-8")
 
 
 def load_template_names() -> List[str]:
     """Load template names from ecommerce_dictionary.json (excluding feature elements and header/footer templates)"""
     try:
         dict_path = Path(__file__).parent / "ecommerce_dictionary.json"
-        with open(dict_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _json_loads(dict_path.read_bytes())
         
         template_names = []
         excluded_templates = {"Header Template", "Footer Template"}
@@ -138,7 +151,6 @@ def load_template_names() -> List[str]:
 def extract_brand_name_from_url(url: str) -> str:
     """Extract a clean brand name from the URL domain."""
     try:
-        from urllib.parse import urlparse
         parsed = urlparse(url)
         domain = parsed.netloc.lower()
         
@@ -164,22 +176,27 @@ def extract_brand_name_from_url(url: str) -> str:
         return "Homepage"
 
 
+# Paths (lower-cased, trailing slash removed) that count as the homepage
+_HOMEPAGE_PATHS = frozenset({'', '/', '/index.html', '/index.php', '/home'})
+
+
+@functools.lru_cache(maxsize=64)
+def _base_netloc(base_url: str) -> str:
+    """Domain of the base URL, parsed once per base URL rather than once per link checked against it."""
+    return urlparse(base_url).netloc
+
+
 def is_homepage_url(link_url: str, base_url: str) -> bool:
     """Check if a link URL points to the homepage."""
     try:
-        from urllib.parse import urlparse, urljoin
-        
-        # Normalize URLs
-        base_parsed = urlparse(base_url)
         link_parsed = urlparse(link_url)
         
         # If different domains, not homepage
-        if link_parsed.netloc and link_parsed.netloc != base_parsed.netloc:
+        if link_parsed.netloc and link_parsed.netloc != _base_netloc(base_url):
             return False
         
         # Check common homepage patterns
-        path = link_parsed.path.lower().rstrip('/')
-        return path in ['', '/', '/index.html', '/index.php', '/home']
+        return link_parsed.path.lower().rstrip('/') in _HOMEPAGE_PATHS
         
     except Exception:
         return False
@@ -225,11 +242,8 @@ async def categorize_links_by_template(links: List[Dict[str, str]], template_nam
     Returns:
         Dictionary with categorized links
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
-    
-    client = OpenAI(api_key=api_key)
+    # Shared pooled client, so connections are reused across calls and with the other analyzers
+    client = get_async_openai_client().with_options(max_retries=_MAX_RETRIES)
     
     # Prepare links text for AI analysis
     links_text = ""
@@ -241,8 +255,10 @@ async def categorize_links_by_template(links: List[Dict[str, str]], template_nam
     
     print("    > Categorizing links by template...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-5-mini",
+            # JSON mode guarantees a parseable object, so the regex fallbacks are only a safety net
+            response_format={"type": "json_object"},
             messages=[
                 {
                     "role": "system",
@@ -364,21 +380,19 @@ async def analyze_site_links(header_image_path: Path, header_html_path: Path,
     Returns:
         Dictionary containing all discovered links
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable is required")
+    # Shared pooled client, so connections are reused across calls and with the other analyzers
+    client = get_async_openai_client().with_options(max_retries=_MAX_RETRIES)
     
-    client = OpenAI(api_key=api_key)
-    
-    # Load and encode images
-    print("    > Loading header and footer images...", file=sys.stderr)
-    header_b64 = _encode_image_to_base64(header_image_path)
-    footer_b64 = _encode_image_to_base64(footer_image_path)
-    
-    # Load HTML content with chunking
-    print("    > Loading header and footer HTML content...", file=sys.stderr)
-    header_html_full = _load_html_content(header_html_path)
-    footer_html_full = _load_html_content(footer_html_path)
+    # Encode both images, read both HTML files and load the template names concurrently in worker
+    # threads; the template names are only needed after the extraction call but cost nothing to have ready
+    print("    > Loading header and footer images and HTML content...", file=sys.stderr)
+    header_data_url, footer_data_url, header_html_full, footer_html_full, template_names = await asyncio.gather(
+        asyncio.to_thread(_encode_image_to_data_url, header_image_path),
+        asyncio.to_thread(_encode_image_to_data_url, footer_image_path),
+        asyncio.to_thread(_load_html_content, header_html_path),
+        asyncio.to_thread(_load_html_content, footer_html_path),
+        asyncio.to_thread(load_template_names)
+    )
     
     # Use chunking for large HTML content (48KB chunks)
     header_chunks = _chunk_html_content(header_html_full, 48000)
@@ -392,8 +406,10 @@ async def analyze_site_links(header_image_path: Path, header_html_path: Path,
     
     print("    > Sending request to GPT-5-mini...", file=sys.stderr)
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-5-mini",
+            # JSON mode guarantees a parseable object, so the regex fallbacks are only a safety net
+            response_format={"type": "json_object"},
             messages=[
                 {
                     "role": "system",
@@ -464,14 +480,14 @@ Be comprehensive - include every single clickable link you can find in both sect
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{header_b64}",
+                                "url": header_data_url,
                                 "detail": "high"
                             }
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{footer_b64}",
+                                "url": footer_data_url,
                                 "detail": "high"
                             }
                         }
@@ -493,8 +509,7 @@ Be comprehensive - include every single clickable link you can find in both sect
             link_count = len(links)
             print(f"    > Site links analysis completed successfully - found {link_count} links", file=sys.stderr)
             
-            # Load template names and categorize links
-            template_names = load_template_names()
+            # Categorize links by the template names loaded alongside the page files
             print(f"    > Loaded {len(template_names)} template names", file=sys.stderr)
             categorization_result = None
             
@@ -563,8 +578,6 @@ def print_analysis_results(analysis: Dict[str, Any]) -> None:
 
 # For command line testing
 if __name__ == "__main__":
-    import asyncio
-    
     if len(sys.argv) != 6:
         print("Usage: python site_links_analyzer.py <header_image> <header_html> <footer_image> <footer_html> <url>", file=sys.stderr)
         sys.exit(1)
@@ -3,16 +3,21 @@ Shared utilities for AI analysis modules.
 Consolidates common functions to eliminate code duplication.
 """
 
+import os
+import io
 import base64
 import json
 import re
+import mmap
+import functools
+import httpx
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
-from dotenv import load_dotenv
-from openai import OpenAI
+from PIL import Image
+from openai import OpenAI, AsyncOpenAI
 
-# Load environment variables
-load_dotenv()
+# Code block fallback for replies that aren't a bare JSON document, compiled once at import
+_JSON_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
 
 
 def extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
@@ -39,34 +44,153 @@ def extract_json_from_response(resp) -> Tuple[Optional[dict], str]:
         data = json.loads(raw_text)
     except json.JSONDecodeError:
         # If that fails, try to find JSON within code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', raw_text, re.DOTALL)
+        json_match = _JSON_CODE_BLOCK_RE.search(raw_text)
         if json_match:
             try:
                 data = json.loads(json_match.group(1))
             except json.JSONDecodeError:
                 pass
         
-        # If still no luck, try to find any JSON-like structure
+        # If still no luck, try each balanced {...} object found by a linear brace scan
         if data is None:
-            json_match = re.search(r'(\{.*\})', raw_text, re.DOTALL)
-            if json_match:
+            for candidate_json in iter_json_objects(raw_text):
                 try:
-                    data = json.loads(json_match.group(1))
+                    data = json.loads(candidate_json)
+                    break
                 except json.JSONDecodeError:
-                    pass
+                    continue
     
     return data, raw_text
 
 
-def encode_image_to_base64(image_path: Path) -> str:
+class JsonObjectScanner:
+    """
+    Incrementally tracks brace depth over streamed text to tell when the first
+    top-level JSON object is complete. Braces inside string literals (including
+    escaped quotes) are ignored.
+    """
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> int:
+        """Consume text and return the index just past the closing brace, or -1 if not complete yet."""
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.started:
+                    self.in_string = True
+            elif char == '{':
+                self.started = True
+                self.depth += 1
+            elif char == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return -1
+
+
+def iter_json_objects(text: str):
+    """
+    Yield each balanced top-level {...} object in text, left to right.
+    
+    Uses JsonObjectScanner, so the scan is linear in the text length, respects
+    braces inside strings and handles arbitrarily deep nesting.
+    """
+    start = text.find('{')
+    while start >= 0:
+        end = JsonObjectScanner().feed(text[start:])
+        if end < 0:
+            return
+        yield text[start:start + end]
+        start = text.find('{', start + end)
+
+
+async def read_streamed_json(stream) -> str:
+    """
+    Accumulate a streamed chat completion and stop reading as soon as the first
+    top-level JSON object is complete, instead of waiting for the end of the stream.
+    """
+    scanner = JsonObjectScanner()
+    parts: List[str] = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if not content:
+                continue
+            end = scanner.feed(content)
+            if end >= 0:
+                parts.append(content[:end])
+                break
+            parts.append(content)
+    finally:
+        await stream.close()
+    return "".join(parts)
+
+
+# Elements that carry no signal for layout/feature analysis and are dropped before prompting
+_NON_CONTENT_ELEMENT_RE = re.compile(r'<(script|style|svg|noscript|iframe)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_START_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)(\s[^<>]*?)?(/?)>')
+_ATTRIBUTE_RE = re.compile(r'''([^\s=/>]+)(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]+))?''')
+_WHITESPACE_RE = re.compile(r'\s+')
+_KEPT_ATTRIBUTES = frozenset({'href', 'id', 'class', 'type', 'name', 'role', 'aria-label', 'data-testid'})
+
+
+def minify_html_for_llm(html_content: str) -> str:
+    """
+    Shrink HTML before it is embedded in a prompt.
+    
+    Drops script/style/svg/noscript/iframe elements and comments, keeps only
+    the attributes useful for identifying features (href, id, class, type,
+    name, role, aria-label, data-testid) and collapses whitespace. Input tokens drive
+    both cost and time-to-first-token, so this is applied to every body and
+    footer prompt.
+    """
+    def strip_attributes(match: re.Match) -> str:
+        tag, attributes, self_closing = match.groups()
+        kept = [attr.group(0) for attr in _ATTRIBUTE_RE.finditer(attributes or '')
+                if attr.group(1).lower() in _KEPT_ATTRIBUTES]
+        return f"<{tag}{' ' if kept else ''}{' '.join(kept)}{self_closing}>"
+    
+    minified = _NON_CONTENT_ELEMENT_RE.sub('', html_content)
+    minified = _HTML_COMMENT_RE.sub('', minified)
+    minified = _START_TAG_RE.sub(strip_attributes, minified)
+    return _WHITESPACE_RE.sub(' ', minified).strip()
+
+
+# Data URL header for PNG screenshots, passed as the prefix to encode_image_to_base64
+PNG_DATA_URL_PREFIX = "data:image/png;base64,"
+
+# Input block size for incremental base64 encoding; a multiple of 3 so blocks encode without padding
+_BASE64_BLOCK_SIZE = 57 * 1024
+
+
+def encode_image_to_base64(image_path: Path, prefix: str = "") -> str:
     """
     Encode an image file to base64 string for API transmission.
     
+    The file is read through mmap and encoded block by block into one buffer
+    that already holds the prefix, so neither the whole binary image nor a
+    separate full-size base64 copy is held in memory alongside the result.
+    
     Args:
         image_path: Path to the image file
+        prefix: Text to place before the encoded data, e.g. a data URL header
         
     Returns:
-        Base64 encoded string of the image
+        Base64 encoded string of the image, preceded by prefix
         
     Raises:
         FileNotFoundError: If image file doesn't exist
@@ -75,11 +199,50 @@ def encode_image_to_base64(image_path: Path) -> str:
     if not image_path.exists():
         raise FileNotFoundError(f"Image file not found: {image_path}")
     
+    encoded = bytearray(prefix.encode('ascii'))
     try:
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            if os.fstat(image_file.fileno()).st_size == 0:
+                return prefix
+            with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset in range(0, len(mm), _BASE64_BLOCK_SIZE):
+                    encoded += base64.b64encode(mm[offset:offset + _BASE64_BLOCK_SIZE])
     except IOError as e:
         raise IOError(f"Failed to read image file {image_path}: {e}")
+    # The base64 alphabet is pure ASCII, so ascii decoding skips UTF-8 validation
+    return encoded.decode('ascii')
+
+
+# OpenAI vision fits images within 2048x2048 and then scales the shortest side down to 768px,
+# so pixels beyond these bounds are discarded server-side anyway
+_VISION_MAX_SIDE = 2048
+_VISION_MAX_SHORT_SIDE = 768
+_VISION_WEBP_QUALITY = 80
+
+
+def encode_image_for_vision(image_path: Path) -> Optional[str]:
+    """
+    Downscale an image to the resolution the vision model actually uses and
+    re-encode it as WebP, returning a data URL.
+    
+    Full-page PNG screenshots are often several MB; after resizing and WebP
+    compression the upload is typically a small fraction of that, with the
+    same number of image tiles reaching the model. Returns None when the image
+    needed no resizing and WebP would not be smaller than the original file.
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+        scale = min(1.0, _VISION_MAX_SIDE / max(width, height))
+        scale *= min(1.0, _VISION_MAX_SHORT_SIDE / (min(width, height) * scale))
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "WEBP", quality=_VISION_WEBP_QUALITY, method=4)
+    if scale >= 1.0 and buffer.tell() >= image_path.stat().st_size:
+        return None
+    return "data:image/webp;base64," + base64.b64encode(buffer.getbuffer()).decode('ascii')
 
 
 def load_html_content(html_path: Path) -> str:
@@ -116,6 +279,39 @@ def create_openai_client() -> OpenAI:
     return OpenAI()
 
 
+# Connection pool for the shared async client, sized so concurrent analyses don't hit httpx.PoolTimeout
+_HTTP_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=128, keepalive_expiry=60.0)
+_HTTP_TIMEOUT = httpx.Timeout(connect=10.0, read=120.0, write=30.0, pool=30.0)
+
+
+@functools.lru_cache(maxsize=1)
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Return the process-wide AsyncOpenAI client, creating it on first use.
+    
+    Reusing one client keeps its connection pool alive, so the TCP + TLS
+    handshake is paid once per process instead of once per call. The client
+    is built with max_retries=0, so nothing is retried unless the caller asks:
+    the header, footer and site-links analyzers opt in per request through
+    with_options(max_retries=...), and the body analyzer retries in its own
+    jittered loop.
+    
+    Returns:
+        Shared AsyncOpenAI client instance
+        
+    Raises:
+        ValueError: If OPENAI_API_KEY is not set
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    return AsyncOpenAI(
+        api_key=api_key,
+        http_client=httpx.AsyncClient(limits=_HTTP_LIMITS, timeout=_HTTP_TIMEOUT),
+        max_retries=0
+    )
+
+
 def create_standard_error_response(error_msg: str, **additional_fields) -> Dict[str, Any]:
     """
     Create standardized error response dictionary.
@@ -152,3 +348,60 @@ def create_standard_success_response(data: Dict[str, Any], **additional_fields)
         **additional_fields
     }
     return response
+
+
+# JSON schemas for OpenAI structured outputs shared by the template-based analyzers
+TEMPLATE_FEATURES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "features": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                    "found": {"type": "string", "enum": ["yes", "no"]}
+                },
+                "required": ["name", "description", "found"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["name", "description", "features"],
+    "additionalProperties": False
+}
+
+CUSTOM_FEATURES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "custom_features": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"}
+                },
+                "required": ["name", "description"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["custom_features"],
+    "additionalProperties": False
+}
+
+
+def json_schema_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a strict structured-output response_format for the given schema."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "schema": schema,
+            "strict": True
+        }
+    }